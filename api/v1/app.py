@@ -3,12 +3,30 @@
 """This module handles environment setup for michote API"""
 
 from flask import Flask, make_response, jsonify
+from flask.json.provider import JSONProvider
 from os import getenv
-from models import storage
+from models import storage, orm_storage
+from models.engine import fast_json
 from api.v1.views import app_views
 from flask_cors import CORS
 
+class FastJSONProvider(JSONProvider):
+    """Flask JSON provider backed by `models.engine.fast_json`.
+
+    Uses orjson when it is installed and serializes datetime objects in ISO
+    format.
+    """
+
+    def dumps(self, obj, **kwargs):
+        """Serializes an object to a JSON string"""
+        return fast_json.dumps(obj)
+
+    def loads(self, s, **kwargs):
+        """Deserializes a JSON string or bytes"""
+        return fast_json.loads(s)
+
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 CORS(app)
 
 app.register_blueprint(app_views)
@@ -16,6 +34,14 @@ app.register_blueprint(app_views)
 host = getenv('MICHOTE_API_HOST', '0.0.0.0')
 port = getenv('MICHOTE_API_PORT', 5000)
 
+def refresh_storage():
+    """Picks up the changes made to storage by other processes, eg other
+    workers of a pre-forking server, before handling a request"""
+    storage.close()
+
+if not orm_storage and getenv('MICHOTE_FILE_MULTIPROCESS') == '1':
+    app.before_request(refresh_storage)
+
 @app.teardown_appcontext
 def end_session(Exception):
     """Function called on session termination"""
@@ -5,6 +5,7 @@
 from models import storage
 from api.v1.views import app_views
 from flask import abort, jsonify, make_response, request
+from api.v1.views.listing import page_args, list_response
 from models.admin import Admin
 
 admin_attributes = ['username', 'password', 'email', 'phone_number']
@@ -18,14 +19,12 @@ def desc_gen(missing_att_list):
 
 @app_views.route('/admins', methods=['GET'], strict_slashes=False)
 def get_all_admins():
-    """Method called to get all Admin objects from storage"""
-    admins_list = []
+    """Method called to get all Admin objects from storage.
 
-    admins_dict = storage.all(Admin)
-    for admin_obj in admins_dict.values():
-        admins_list.append(admin_obj.to_dict())
-
-    return jsonify(admins_list)
+    Supports pagination with the `limit` and `cursor` query string parameters.
+    """
+    page = page_args()
+    return list_response(storage.iterate(Admin, **page), page)
 
 @app_views.route('/admins/<admin_id>', methods=['GET'], strict_slashes=False)
 def get_one_admin(admin_id):
@@ -61,10 +60,8 @@ def create_admin():
         desc = desc_gen(missing_atts)
         abort(400, description=desc)
 
-    admin_dict = storage.all(Admin)
-    for admin_obj in admin_dict.values():
-        if admin_obj.email == request.get_json()['email']:
-            abort(409, description='User with that email already exists')
+    if storage.exists(Admin, email=request.get_json()['email']):
+        abort(409, description='User with that email already exists')
 
     info = request.get_json()
     admin_obj = Admin(**info)
@@ -85,11 +82,10 @@ def auth_admin():
         desc = desc_gen(['password'])
         abort(400, description=desc)
 
-    admins_dict = storage.all(Admin)
-    for admin_obj in admins_dict.values():
-        if admin_obj.email == request.get_json()['email'] and \
-           admin_obj.password == request.get_json()['password']:
-            return make_response(jsonify({'auth_status':'SUCCESS', 'user_id': admin_obj.id}), 200)
+    admin_obj = storage.first(Admin, email=request.get_json()['email'],
+                              password=request.get_json()['password'])
+    if admin_obj:
+        return make_response(jsonify({'auth_status':'SUCCESS', 'user_id': admin_obj.id}), 200)
     return make_response(jsonify({'auth_status':'FAIL'}), 404)
 
 @app_views.route('admins/<admin_id>', methods=['PUT'], strict_slashes=False)
@@ -109,5 +105,5 @@ def update_admin(admin_id):
     for key, value in info.items():
         if key not in ignore_atts:
             setattr(admin_obj, key, value)
-    storage.save()
+    admin_obj.save()
     return make_response(jsonify(admin_obj.to_dict()), 200)
@@ -5,6 +5,7 @@
 from models import storage
 from api.v1.views import app_views
 from flask import abort, jsonify, make_response, request
+from api.v1.views.listing import page_args, list_response, search_args
 from models.booked_trip import BookedTrip
 from models.route import Route
 
@@ -26,32 +27,25 @@ def get_bookings():
     matching object is returned from storage, if found.
     If no query string is passed, all BookedTrip objects are returned.
     If no matching object is found for query strin, empty dict is returned.
+    All results support pagination with the `limit` and `cursor` query string
+    parameters.
     """
-    trips_list = []
-    args = request.args
+    args = search_args()
+    page = page_args()
     if not args:
-        trips_dict = storage.all(BookedTrip)
-        for trip_obj in trips_dict.values():
-            trips_list.append(trip_obj.to_dict())
-        return jsonify(trips_list)
+        return list_response(storage.iterate(BookedTrip, **page), page)
 
-    if args('route_id'):
+    if args.get('route_id'):
         route = args.get('route_id')
-        trips_dict = storage.all(BookedTrip)
-        for trip_obj in trips_dict.values():
-            if trip_obj.route_id == route:
-                trips_list.append(trip_obj.to_dict())
-            
-        return jsonify(trips_list)
-
-    if args('customer_id'):
+        trips = storage.iterate(BookedTrip, route_id=route, **page)
+        return list_response(trips, page)
+
+    if args.get('customer_id'):
         customer = args.get('customer_id')
-        trips_dict = storage.all(BookedTrip)
-        for trip_obj in trips_dict.values():
-            if trip_obj.customer_id == customer:
-                trips_list.append(trip_obj.to_dict())
-            
-        return jsonify(trips_list)
+        trips = storage.iterate(BookedTrip, customer_id=customer, **page)
+        return list_response(trips, page)
+
+    return list_response([], page)
 
 @app_views.route('/bookings/<trip_id>', methods=['GET'], strict_slashes=False)
 def get_one_trip(trip_id):
@@ -64,13 +58,14 @@ def get_one_trip(trip_id):
 
 @app_views.route('/bookings/<trip_id>', methods=['DELETE'], strict_slashes=False)
 def delete_trip(trip_id):
-    """Deletes a specific trip record from storage"""
+    """Deletes a specific trip record from storage and gives its seats back
+    to its route"""
     trip = storage.get(BookedTrip, trip_id)
 
     if not trip:
         abort(404)
-    storage.delete(trip)
-    storage.save()
+    if not storage.release_seats(trip):
+        abort(404)
 
     return make_response(jsonify({}), 200)
 
@@ -88,8 +83,14 @@ def add_new_trip():
         abort(400, description=desc)
 
     info = request.get_json()
+    seats = info.get('no_of_seats_booked')
+    if type(seats) is not int or seats < 1:
+        abort(400, description='no_of_seats_booked must be a positive integer')
+    if not storage.get(Route, info.get('route_id')):
+        abort(404)
     trip_obj = BookedTrip(**info)
-    trip_obj.save()
+    if not storage.reserve_seats(trip_obj):
+        abort(409, description='Not enough seats available')
 
     return make_response(jsonify(trip_obj.to_dict()), 201)
 
@@ -107,8 +108,15 @@ def update_trip(trip_id):
 
     ignore_atts = ['id', 'created_at', 'last_updated']
 
+    # The seats of a booking are taken from its route when it is created:
+    # a booking for another route or number of seats is a new booking
+    for key in ('route_id', 'no_of_seats_booked'):
+        if key in info and info[key] != getattr(trip_obj, key):
+            abort(400, description=f'{key} cannot be changed, cancel the '
+                  'booking and book again')
+
     for key, value in info.items():
         if key not in ignore_atts:
             setattr(trip_obj, key, value)
-    storage.save()
+    trip_obj.save()
     return make_response(jsonify(trip_obj.to_dict()), 200)
@@ -5,6 +5,7 @@
 from models import storage
 from api.v1.views import app_views
 from flask import abort, jsonify, make_response, request
+from api.v1.views.listing import page_args, list_response
 from models.customer import Customer
 
 customer_attributes = ['first_name', 'last_name', 'email',
@@ -19,14 +20,12 @@ def desc_gen(missing_att_list):
 
 @app_views.route('/users', methods=['GET'], strict_slashes=False)
 def get_all_users():
-    """Method called to get all User objects from storage"""
-    customer_list = []
+    """Method called to get all User objects from storage.
 
-    customer_dict = storage.all(Customer)
-    for customer_obj in customer_dict.values():
-        customer_list.append(customer_obj.to_dict())
-
-    return jsonify(customer_list)
+    Supports pagination with the `limit` and `cursor` query string parameters.
+    """
+    page = page_args()
+    return list_response(storage.iterate(Customer, **page), page)
 
 @app_views.route('/users/<user_id>', methods=['GET'], strict_slashes=False)
 def get_one_user(user_id):
@@ -62,10 +61,8 @@ def create_user():
         desc = desc_gen(missing_atts)
         abort(400, description=desc)
 
-    customer_dict = storage.all(Customer)
-    for customer_obj in customer_dict.values():
-        if customer_obj.email == request.get_json()['email']:
-            abort(409, description='User with that email already exists')
+    if storage.exists(Customer, email=request.get_json()['email']):
+        abort(409, description='User with that email already exists')
 
     info = request.get_json()
     customer_obj = Customer(**info)
@@ -86,11 +83,10 @@ def auth_user():
         desc = desc_gen(['password'])
         abort(400, description=desc)
 
-    customer_dict = storage.all(Customer)
-    for customer_obj in customer_dict.values():
-        if customer_obj.email == request.get_json()['email'] and \
-           customer_obj.password == request.get_json()['password']:
-            return make_response(jsonify({'auth_status':'SUCCESS', 'user_id': customer_obj.id}), 200)
+    customer_obj = storage.first(Customer, email=request.get_json()['email'],
+                                 password=request.get_json()['password'])
+    if customer_obj:
+        return make_response(jsonify({'auth_status':'SUCCESS', 'user_id': customer_obj.id}), 200)
     return make_response(jsonify({'auth_status':'FAIL'}), 404)
 
 @app_views.route('users/<user_id>', methods=['PUT'], strict_slashes=False)
@@ -110,5 +106,5 @@ def update_user(user_id):
     for key, value in info.items():
         if key not in ignore_atts:
             setattr(customer_obj, key, value)
-    storage.save()
+    customer_obj.save()
     return make_response(jsonify(customer_obj.to_dict()), 200)
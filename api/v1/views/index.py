@@ -2,9 +2,17 @@
 
 """This module handles utility functions for the API"""
 
+import time
 from api.v1.views import app_views
-from flask import jsonify
+from flask import abort, jsonify
 from models import storage
+from os import getenv
+
+# Number of seconds for which the result of /stats is reused. The cached
+# result is also dropped as soon as anything is written to storage.
+STATS_TTL = float(getenv('MICHOTE_STATS_TTL', 5))
+
+stats_cache = {'generation': None, 'expires_at': 0, 'stats': None}
 
 @app_views.route('/status', methods=['GET'], strict_slashes=False)
 def status_okay():
@@ -13,11 +21,45 @@ def status_okay():
 
 @app_views.route('/stats', methods=['GET'], strict_slashes=False)
 def get_no_of_objects():
-    """Retrieves the number of objects of each type from storage"""
-    return jsonify({
+    """Retrieves the number of objects of each type from storage.
+
+    The counts are cached for `MICHOTE_STATS_TTL` seconds, or until storage is
+    written to.
+    """
+    generation = storage.generation()
+    now = time.monotonic()
+    if stats_cache['generation'] == generation and \
+       stats_cache['expires_at'] > now:
+        return jsonify(stats_cache['stats'])
+
+    stats = {
         'Admins': storage.count('Admin'),
         'Customers': storage.count('Customer'),
         'Partners': storage.count('Partner'),
         'Routes': storage.count('Route'),
         'BookedTrips': storage.count('BookedTrip')
-    })
+    }
+    stats_cache.update({'generation': generation,
+                        'expires_at': now + STATS_TTL, 'stats': stats})
+    return jsonify(stats)
+
+@app_views.route('/stats/pool', methods=['GET'], strict_slashes=False)
+def get_pool_stats():
+    """Retrieves the statistics of the database connection pool: the number
+    of connections checked out, idle and opened beyond the pool size, and
+    the number and duration of the checkouts.
+
+    Not found when storage does not use a database.
+    """
+    if not hasattr(storage, 'pool_stats'):
+        abort(404)
+    return jsonify(storage.pool_stats())
+
+@app_views.route('/stats/reservations', methods=['GET'], strict_slashes=False)
+def get_reservation_stats():
+    """Retrieves the counters of the seat reservations: the number of
+    reservations made and rejected for lack of seats, how many waited for
+    another reservation on the same route, the time taken to take the seats,
+    and the routes with the most contended reservations.
+    """
+    return jsonify(storage.reservation_stats())
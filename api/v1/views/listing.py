@@ -0,0 +1,99 @@
+#!/usr/bin/python3
+
+"""Helpers shared by the API handlers that return lists of objects.
+
+List endpoints accept two optional query string parameters:
+    `limit` - the maximum number of objects to return.
+    `cursor` - the `next_cursor` returned with the previous page.
+
+Without them, the endpoint returns a JSON array of all matching objects. With
+them, it returns a JSON object holding the page of objects under `results`
+and the cursor of the next page under `next_cursor`. `next_cursor` is null on
+the last page.
+
+Responses are streamed: objects are read from storage and serialized one at a
+time, so the full list is never held in memory.
+"""
+
+from flask import Response, abort, current_app, request, stream_with_context
+from os import getenv
+from models.engine.pagination import encode_cursor, decode_cursor
+
+PAGE_PARAMS = ('limit', 'cursor')
+
+DEFAULT_PAGE_SIZE = int(getenv('MICHOTE_API_PAGE_SIZE', 100))
+MAX_PAGE_SIZE = int(getenv('MICHOTE_API_MAX_PAGE_SIZE', 1000))
+
+def search_args():
+    """Returns the query string parameters that are not pagination
+    parameters.
+    """
+    return {key: value for key, value in request.args.items()
+            if key not in PAGE_PARAMS}
+
+def page_args():
+    """Reads the pagination parameters from the query string.
+
+    Aborts with 400 if they are not valid.
+
+    Returns
+    -------
+    dict
+        `limit` and `cursor` to be passed to `storage.all()` or
+        `storage.filter()`. Empty if the request is not paginated.
+    """
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+    if limit is None and cursor is None:
+        return {}
+
+    if limit is None:
+        limit = DEFAULT_PAGE_SIZE
+    else:
+        try:
+            limit = int(limit)
+        except ValueError:
+            abort(400, description='limit must be an integer')
+        if limit < 1:
+            abort(400, description='limit must be greater than 0')
+        limit = min(limit, MAX_PAGE_SIZE)
+
+    if cursor is not None:
+        try:
+            decode_cursor(cursor)
+        except ValueError:
+            abort(400, description='Invalid cursor')
+    return {'limit': limit, 'cursor': cursor}
+
+def list_response(objs, page):
+    """Builds the streamed JSON response for a list of objects.
+
+    Parameters
+    ----------
+    objs : iterable
+        The objects to be returned, usually from `storage.iterate()`.
+    page : dict
+        The pagination parameters returned by `page_args()`.
+    """
+    dumps = current_app.json.dumps
+
+    def generate():
+        """Yields the JSON document one object at a time"""
+        yield '{"results": [' if page else '['
+        count = 0
+        last_obj = None
+        for obj in objs:
+            yield (',' if count else '') + dumps(obj)
+            count += 1
+            last_obj = obj
+        if not page:
+            yield ']'
+            return
+
+        next_cursor = None
+        if count and count == page['limit']:
+            next_cursor = encode_cursor(last_obj)
+        yield '], "next_cursor": ' + dumps(next_cursor) + '}'
+
+    return Response(stream_with_context(generate()),
+                    mimetype='application/json')
@@ -5,6 +5,7 @@
 from models import storage
 from api.v1.views import app_views
 from flask import abort, jsonify, make_response, request
+from api.v1.views.listing import page_args, list_response
 from models.partner import Partner
 
 partner_attributes = ['partner_name', 'postal_address', 'email',
@@ -19,14 +20,12 @@ def desc_gen(missing_att_list):
 
 @app_views.route('/partners', methods=['GET'], strict_slashes=False)
 def get_all_partners():
-    """Method called to get all Partner objects from storage"""
-    partner_list = []
+    """Method called to get all Partner objects from storage.
 
-    partner_dict = storage.all(Partner)
-    for partner_obj in partner_dict.values():
-        partner_list.append(partner_obj.to_dict())
-
-    return jsonify(partner_list)
+    Supports pagination with the `limit` and `cursor` query string parameters.
+    """
+    page = page_args()
+    return list_response(storage.iterate(Partner, **page), page)
 
 @app_views.route('/partners/<partner_id>', methods=['GET'], strict_slashes=False)
 def get_one_partner(partner_id):
@@ -62,10 +61,8 @@ def create_partner():
         desc = desc_gen(missing_atts)
         abort(400, description=desc)
 
-    partner_dict = storage.all(Partner)
-    for partner_obj in partner_dict.values():
-        if partner_obj.email == request.get_json()['email']:
-            abort(409, description='Partner with that email already exists')
+    if storage.exists(Partner, email=request.get_json()['email']):
+        abort(409, description='Partner with that email already exists')
 
     info = request.get_json()
     partner_obj = Partner(**info)
@@ -86,11 +83,10 @@ def auth_partner():
         desc = desc_gen(['password'])
         abort(400, description=desc)
 
-    partner_dict = storage.all(Partner)
-    for partner_obj in partner_dict.values():
-        if partner_obj.email == request.get_json()['email'] and \
-           partner_obj.password == request.get_json()['password']:
-            return make_response(jsonify({'auth_status':'SUCCESS', 'user_id': partner_obj.id}), 200)
+    partner_obj = storage.first(Partner, email=request.get_json()['email'],
+                                password=request.get_json()['password'])
+    if partner_obj:
+        return make_response(jsonify({'auth_status':'SUCCESS', 'user_id': partner_obj.id}), 200)
     return make_response(jsonify({'auth_status':'FAIL'}), 404)
 
 @app_views.route('partners/<partner_id>', methods=['PUT'], strict_slashes=False)
@@ -110,5 +106,5 @@ def update_partner(partner_id):
     for key, value in info.items():
         if key not in ignore_atts:
             setattr(partner_obj, key, value)
-    storage.save()
+    partner_obj.save()
     return make_response(jsonify(partner_obj.to_dict()), 200)
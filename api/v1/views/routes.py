@@ -5,6 +5,7 @@
 from models import storage
 from api.v1.views import app_views
 from flask import abort, jsonify, make_response, request
+from api.v1.views.listing import page_args, list_response, search_args
 from models.route import Route
 
 route_attributes = ['partner_id', 'start_destination', 'end_destination', 'period_begin',
@@ -25,23 +26,18 @@ def get_matching_routes():
     If a query strin is passed with start_destination and end_destination, a
     matching object is returned from storage, if found.
     If no query string is passed, all route objects are returned.
+    All results support pagination with the `limit` and `cursor` query string
+    parameters.
     """
-    routes_list = []
-    args = request.args
+    args = search_args()
+    page = page_args()
     if not args:
-        routes_dict = storage.all(Route)
-        for route_obj in routes_dict.values():
-            routes_list.append(route_obj.to_dict())
-        return jsonify(routes_list)
+        return list_response(storage.iterate(Route, **page), page)
 
     if args.get('partner_id'):
-        
         partner = args.get('partner_id')
-        routes_dict = storage.all(Route)
-        for route_obj in routes_dict.values():
-            if route_obj.partner_id == partner:
-                routes_list.append(route_obj.to_dict())
-        return jsonify(routes_list)
+        routes = storage.iterate(Route, partner_id=partner, **page)
+        return list_response(routes, page)
 
     if args.get('start_destination') and args.get('end_destination'):
         start_dest = args.get('start_destination')
@@ -51,15 +47,11 @@ def get_matching_routes():
         if not end_dest:
            abort(400, description='Missing end_destination in query string')
 
-        routes_dict = storage.all(Route)
-        for route_obj in routes_dict.values():
-             if route_obj.start_destination.lower() == start_dest.lower() and \
-                route_obj.end_destination.lower() == end_dest.lower():
-                 routes_list.append(route_obj.to_dict())
+        routes = storage.iterate(Route, start_destination__iexact=start_dest,
+                                 end_destination__iexact=end_dest, **page)
+        return list_response(routes, page)
 
-        return jsonify(routes_list)
-    
-    return jsonify(routes_list)
+    return list_response([], page)
 
 @app_views.route('/routes/<route_id>', methods=['GET'], strict_slashes=False)
 def get_one_route(route_id):
@@ -95,15 +87,13 @@ def create_route():
         desc = desc_gen(missing_atts)
         abort(400, description=desc)
 
-    route_dict = storage.all(Route)
     rpartner_id = request.get_json()['partner_id']
     rstart_destination = request.get_json()['start_destination']
     rend_destination = request.get_json()['end_destination']
-    for route_obj in route_dict.values():
-        if route_obj.partner_id == rpartner_id and \
-        route_obj.start_destination == rstart_destination and \
-           route_obj.end_destination == rend_destination:
-            abort(409, description='That route already exists !')
+    if storage.exists(Route, partner_id=rpartner_id,
+                      start_destination=rstart_destination,
+                      end_destination=rend_destination):
+        abort(409, description='That route already exists !')
 
     info = request.get_json()
     route_obj = Route(**info)
@@ -111,6 +101,55 @@ def create_route():
 
     return make_response(jsonify(route_obj.to_dict()), 201)
 
+@app_views.route('routes/bulk', methods=['POST'], strict_slashes=False)
+def create_routes():
+    """Creates or replaces many route objects at once, eg a partner's
+    seasonal timetable.
+
+    The body is a list of routes with the attributes required by
+    `create_route()`. A route with the `id` of an existing route replaces
+    it. All the routes are written in a single transaction, and none is
+    written if any of them is invalid or already exists.
+    """
+    routes = request.get_json(silent=True)
+    if not isinstance(routes, list) or \
+       not all(isinstance(info, dict) for info in routes):
+        abort(400, description='Not a JSON list of routes')
+    for position, info in enumerate(routes):
+        missing_atts = [attribute for attribute in route_attributes
+                        if attribute not in info]
+        if missing_atts:
+            abort(400, description=f'Route {position}: ' +
+                  desc_gen(missing_atts))
+
+    # A route must not duplicate another route of the request, nor a route
+    # in storage other than the routes the request replaces, which take the
+    # destinations given in the request. The routes of the partners are
+    # read once from the primary database, as `create_route()` does.
+    replaced = {info['id'] for info in routes if info.get('id')}
+    stored = {}
+    for partner_id in {info['partner_id'] for info in routes}:
+        for route in storage.filter(Route, partner_id=partner_id,
+                                    primary=True).values():
+            route_key = (route.partner_id, route.start_destination,
+                         route.end_destination)
+            stored.setdefault(route_key, set()).add(route.id)
+    requested = {}
+    for position, info in enumerate(routes):
+        route_key = (info['partner_id'], info['start_destination'],
+                     info['end_destination'])
+        route_id = info.get('id') or object()
+        if requested.setdefault(route_key, route_id) != route_id or \
+           stored.get(route_key, set()) - replaced:
+            abort(409, description=f'Route {position}: '
+                  'That route already exists !')
+
+    try:
+        ids = storage.bulk_upsert(Route, routes)
+    except ValueError as error:
+        abort(400, description=str(error))
+    return make_response(jsonify({'ids': ids}), 201)
+
 @app_views.route('routes/<route_id>', methods=['PUT'], strict_slashes=False)
 def update_route(route_id):
     """Updates route information"""
@@ -128,5 +167,5 @@ def update_route(route_id):
     for key, value in info.items():
         if key not in ignore_atts:
             setattr(route_obj, key, value)
-    storage.save()
+    route_obj.save()
     return make_response(jsonify(route_obj.to_dict()), 200)
@@ -5,20 +5,29 @@ This initialization module is responsible for creating a variable that holds
 an instance of the storage engine class.
 
 The storage type is set as an environment variable called `MICHOTE_TYPE_STORAGE`
-Two storage types exist:
+Three storage types exist:
     1. File storage - Which is the default type storage when no type storage is
         specified.
-    2. Database storage - The database in use is MySQL database.
+    2. Database storage (`db`) - The database in use is MySQL database.
+    3. SQLite storage (`sqlite`) - An embedded SQLite database file, queried
+        through the same SQLAlchemy mappings as the MySQL database.
+
+`orm_storage` is True when the models are mapped to database tables, ie for
+the `db` and `sqlite` storage types.
 """
 
 from os import getenv
 
 storage_type = getenv('MICHOTE_TYPE_STORAGE')
+orm_storage = storage_type in ('db', 'sqlite')
 
 
 if storage_type == 'db':
     from models.engine.db_storage import DB_Storage
     storage = DB_Storage()
+elif storage_type == 'sqlite':
+    from models.engine.sqlite_storage import SQLite_Storage
+    storage = SQLite_Storage()
 else:
     from models.engine.file_storage import FileStorage
     storage = FileStorage()
@@ -5,7 +5,7 @@
 import models
 
 from os import getenv
-from models.base_model import BaseModel, Base
+from models.base_model import BaseModel, Base, table_indexes
 from sqlalchemy import Column, String
 
 class Admin(BaseModel, Base):
@@ -14,8 +14,11 @@ class Admin(BaseModel, Base):
     Attributes are mapped to MySQL database using SQLALchemy ORM.
     """
 
-    if models.storage_type == 'db':
+    __indexes__ = (('email',),)
+
+    if models.orm_storage:
         __tablename__ = 'admins'
+        __table_args__ = table_indexes(__tablename__, __indexes__)
         username = Column(String(128), nullable=False)
         password = Column(String(128), nullable=False)
         email = Column(String(128), nullable=False)
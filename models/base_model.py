@@ -7,14 +7,42 @@ import datetime
 import models
 
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, String, DateTime
+from sqlalchemy import Column, String, DateTime, Index, text
 from os import getenv
 
-if models.storage_type == 'db':
+if models.orm_storage:
     Base = declarative_base()
 else:
     Base = object
 
+def table_indexes(table_name, indexes, case_insensitive=()):
+    """Builds the SQLAlchemy indexes for the attributes declared in a model's
+    `__indexes__` attribute.
+
+    Used as the `__table_args__` of a mapped class. An index on
+    `(created_at, id)`, the order objects are paginated in, is always added.
+
+    Parameters
+    ----------
+    table_name : str
+        Name of the table the indexes belong to.
+    indexes : tuple
+        Tuples of the column names covered by each index.
+    case_insensitive : tuple, optional
+        Tuples of the column names searched with `__iexact`. SQLite compares
+        strings case-sensitively, so those searches compare the lower-cased
+        columns: an index on the lower-cased columns is added for each tuple
+        in SQLite databases. MySQL needs none, its default collations being
+        case-insensitive.
+    """
+    indexes = tuple(indexes) + (('created_at', 'id'),)
+    return tuple(Index(f'ix_{table_name}_{"_".join(columns)}', *columns)
+                 for columns in indexes) + \
+        tuple(Index(f'ix_{table_name}_lower_{"_".join(columns)}',
+                    *(text(f'lower({column})') for column in columns)
+                    ).ddl_if(dialect='sqlite')
+              for columns in case_insensitive)
+
 class BaseModel():
     """BaseModel class implementation.
 
@@ -29,32 +57,50 @@ class BaseModel():
         Time stamp of when the object was created
     last_updated : datetime obj
         Time stamp of when the object was last updated
-    DATETIME_ISO : str
-        ISO standard date time format string. Used with the `datetime.strptime`
-        method to convert datetime objects to string and vice versa.
+    __datetime_fields__ : tuple
+        Names of the attributes holding datetime objects. They are stored as
+        ISO format strings and parsed with `datetime.fromisoformat` when
+        objects are loaded.
+    __indexes__ : tuple
+        Tuples of attribute names that objects are looked up by. Each tuple
+        becomes a database index in database and SQLite storage and an
+        in-memory hash index in file storage.
+    is_dirty : bool
+        True if attributes were changed since the object was created, loaded
+        from storage or last written to storage.
+    changed_fields : frozenset
+        Names of the attributes changed since then.
 
     Methods
     -------
     __init__(*args, **kwargs)
         Creates a new object with attributes passed as a dictionary or as key-
         value pairs.
+    __setattr__(name, value)
+        Sets an attribute and records it as changed.
     __str__()
         Prints the string representation of objects of this class or child
         classes.
     save()
         Save an object of this class or child classes to storage
+    mark_clean()
+        Forgets the changed attributes once the object is written to storage.
     to_dict()
         Converts the object from this class to dict objects with all attributes.
     delete()
         Deletes the object of this class or child classes from storage.
     """
 
-    if models.storage_type == 'db':
+    if models.orm_storage:
         id = Column(String(60), primary_key=True)
         created_at = Column(DateTime, default=datetime.datetime.utcnow)
         last_updated = Column(DateTime, default=datetime.datetime.utcnow)
 
-    DATETIME_ISO = '%Y-%m-%dT%H:%M:%S.%f'
+    __datetime_fields__ = ('created_at', 'last_updated')
+
+    __indexes__ = ()
+
+    __changed_fields = None
 
     def __init__(self, *args, **kwargs):
         """BaseModel constructor."""
@@ -71,27 +117,72 @@ class BaseModel():
                 self.last_updated = self.created_at
             if type(self.created_at) is str:
                 self.created_at = \
-                datetime.datetime.strptime(kwargs['created_at'],
-                                           BaseModel.DATETIME_ISO)
+                datetime.datetime.fromisoformat(kwargs['created_at'])
                 self.last_updated = \
-                datetime.datetime.strptime(kwargs['last_updated'],
-                                           BaseModel.DATETIME_ISO)
+                datetime.datetime.fromisoformat(kwargs['last_updated'])
         else:
             self.id = str(uuid.uuid4())
             self.created_at = datetime.datetime.now()
             self.last_updated = self.created_at
 
+    def __setattr__(self, name, value):
+        """Sets an attribute and records it as changed.
+
+        Setting an attribute to the value it already holds does nothing, so
+        the object does not become dirty and no write is needed. Private
+        attributes (starting with `_`) are not tracked.
+        """
+
+        if name[0] != '_':
+            obj_dict = self.__dict__
+            if name in obj_dict and obj_dict[name] == value:
+                return
+            if self.__changed_fields is None:
+                self.__changed_fields = set()
+            self.__changed_fields.add(name)
+        super().__setattr__(name, value)
+
+    @property
+    def is_dirty(self):
+        """True if attributes were changed since the object was created,
+        loaded from storage or last written to storage.
+        """
+
+        return bool(self.__changed_fields)
+
+    @property
+    def changed_fields(self):
+        """Names of the attributes changed since the object was created,
+        loaded from storage or last written to storage.
+        """
+
+        return frozenset(self.__changed_fields or ())
+
+    def mark_clean(self):
+        """Forgets the changed attributes. Called by the storage engines once
+        the object is written to storage.
+        """
+
+        self.__dict__.pop('_BaseModel__changed_fields', None)
+
     def __str__(self):
         """Prints an object created from this class, or from child classes as
         a string.
         """
 
-        return f'[{self.__class__.__name__}] ({self.id}) {self.__dict__}'
+        obj_dict = {key: value for key, value in self.__dict__.items()
+                    if key != '_BaseModel__changed_fields'}
+        return f'[{self.__class__.__name__}] ({self.id}) {obj_dict}'
 
     def save(self):
-        """Save an object of this class or child classes to storage"""
+        """Save an object of this class or child classes to storage.
+
+        `last_updated` is only changed, and the object only written, if
+        attributes were changed.
+        """
 
-        self.last_updated = datetime.datetime.now()
+        if self.is_dirty:
+            self.last_updated = datetime.datetime.now()
         models.storage.new(self)
         models.storage.save()
 
@@ -104,13 +195,28 @@ class BaseModel():
         removed from the dict.
         """
 
+        obj_as_dict = self._as_record()
+        for name, value in obj_as_dict.items():
+            if isinstance(value, datetime.date):
+                obj_as_dict[name] = value.isoformat()
+
+        return obj_as_dict
+
+    def _as_record(self):
+        """Returns the dict representation written by storage.
+
+        Unlike `to_dict()`, datetime objects are kept as they are: the JSON
+        backend in `models.engine.fast_json` writes them in ISO format
+        without an intermediate string per attribute. Internal to storage
+        and the API.
+        """
+
         obj_as_dict = self.__dict__.copy()
 
         obj_as_dict.update({'__class__' : f'{self.__class__.__name__}'})
-        obj_as_dict['created_at'] = self.created_at.isoformat()
-        obj_as_dict['last_updated'] = self.last_updated.isoformat()
         if '_sa_instance_state' in obj_as_dict:
             del obj_as_dict['_sa_instance_state']
+        obj_as_dict.pop('_BaseModel__changed_fields', None)
 
         return obj_as_dict
 
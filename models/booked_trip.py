@@ -4,7 +4,7 @@
 
 import models
 
-from models.base_model import BaseModel, Base
+from models.base_model import BaseModel, Base, table_indexes
 from os import getenv
 from datetime import datetime
 from sqlalchemy import Column, String, Integer, ForeignKey, DateTime
@@ -27,15 +27,12 @@ class BookedTrip(BaseModel, Base):
     total_amount : int
         The total amount of money paid for the trip
 
-
-    Methods
-    -------
-    to_dict()
-        Converts object from this class into a dict object with all attributes.
-        Overrides the superclass' to_dict method.
     """
-    if models.storage_type == 'db':
+    __indexes__ = (('route_id',), ('customer_id',))
+
+    if models.orm_storage:
         __tablename__ = 'booked_trips'
+        __table_args__ = table_indexes(__tablename__, __indexes__)
         route_id = Column(String(60), nullable=False)
         partner_id = Column(String(60), nullable=False)
         customer_id = Column(String(60), nullable=False)
@@ -54,18 +51,3 @@ class BookedTrip(BaseModel, Base):
         Uses super class constructor.
         """
         super().__init__(*args, **kwargs)
-
-    def to_dict(self):
-        """Converts object from BookedTrip class to dict
-
-        Overrides BaseModels to_dict method because of additional DateTimes
-        that need conversion to ISO format"""
-        obj_as_dict = self.__dict__.copy()
-
-        obj_as_dict.update({'__class__': f'{self.__class__.__name__}'})
-        obj_as_dict['created_at'] = self.created_at.isoformat()
-        obj_as_dict['last_updated'] = self.last_updated.isoformat()
-        if '_sa_instance_state' in obj_as_dict:
-            del obj_as_dict['_sa_instance_state']
-
-        return obj_as_dict
@@ -4,7 +4,7 @@
 
 import models
 
-from models.base_model import BaseModel, Base
+from models.base_model import BaseModel, Base, table_indexes
 from os import getenv
 from sqlalchemy import Column, String, Integer
 
@@ -33,8 +33,11 @@ class Customer(BaseModel, Base):
         Total number of trips booked by user.
 
     """
-    if models.storage_type == 'db':
+    __indexes__ = (('email',),)
+
+    if models.orm_storage:
         __tablename__ = 'customers'
+        __table_args__ = table_indexes(__tablename__, __indexes__)
         first_name = Column(String(128), nullable=False)
         last_name = Column(String(128), nullable=False)
         email = Column(String(128), nullable=False)
@@ -0,0 +1,148 @@
+#!/usr/bin/python3
+
+"""Connection pool of the database storage engine.
+
+The pool is configured with the following environment variables:
+
+    MICHOTE_DB_POOL_SIZE - connections kept open. Defaults to 5.
+    MICHOTE_DB_MAX_OVERFLOW - connections opened on top of the pool size
+        under load and closed once returned. Defaults to 10.
+    MICHOTE_DB_POOL_TIMEOUT - seconds a request waits for a connection when
+        all of them are checked out. Defaults to 30.
+    MICHOTE_DB_POOL_RECYCLE - seconds after which a connection is replaced,
+        which must be lower than the `wait_timeout` of the MySQL server.
+        Defaults to 3600.
+    MICHOTE_DB_POOL_PRE_PING - set to `0` to stop testing connections before
+        handing them out. Defaults to `1`.
+    MICHOTE_DB_CONNECT_TIMEOUT - seconds allowed to open a connection.
+        Defaults to 10.
+"""
+
+import time
+import threading
+from os import getenv
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+# Name of the option setting the connect timeout, for each database driver
+CONNECT_TIMEOUT_ARGS = {'mysql': 'connect_timeout', 'sqlite': 'timeout'}
+
+
+def engine_options(url):
+    """Returns the keyword arguments of `create_engine()` setting up the pool
+    of the given database as configured by the environment.
+
+    Databases that do not use a queue of connections by default, such as
+    in-memory SQLite databases, keep their default pool: only the connect
+    timeout applies to them.
+
+    Parameters
+    ----------
+    url : sqlalchemy.engine.URL
+        The URL of the database.
+
+    Returns
+    -------
+    dict
+        The options to be passed to `create_engine()`.
+    """
+    options = {}
+    connect_timeout_arg = CONNECT_TIMEOUT_ARGS.get(url.get_backend_name())
+    if connect_timeout_arg is not None:
+        options['connect_args'] = {
+            connect_timeout_arg: int(getenv('MICHOTE_DB_CONNECT_TIMEOUT', 10))}
+    if not issubclass(url.get_dialect().get_pool_class(url), QueuePool):
+        return options
+    options.update({
+        'poolclass': TimedQueuePool,
+        'pool_size': int(getenv('MICHOTE_DB_POOL_SIZE', 5)),
+        'max_overflow': int(getenv('MICHOTE_DB_MAX_OVERFLOW', 10)),
+        'pool_timeout': float(getenv('MICHOTE_DB_POOL_TIMEOUT', 30)),
+        'pool_recycle': int(getenv('MICHOTE_DB_POOL_RECYCLE', 3600)),
+        'pool_pre_ping': getenv('MICHOTE_DB_POOL_PRE_PING', '1') == '1',
+    })
+    return options
+
+
+class TimedQueuePool(QueuePool):
+    """Queue of connections that records how long checkouts take.
+
+    The time of a checkout includes waiting for a connection to be returned
+    when the pool is exhausted, opening new connections and testing stale
+    ones (pre-ping).
+
+    Attributes
+    ----------
+    __stats_lock : threading.Lock
+        Guards the counters below.
+    __checkouts : int
+        Number of connections handed out.
+    __timeouts : int
+        Number of checkouts that gave up waiting for a connection.
+    __invalidated : int
+        Number of connections found broken and discarded, eg by pre-ping.
+    __wait_time : float
+        Total number of seconds spent in checkouts.
+    __max_wait_time : float
+        Longest checkout, in seconds.
+    """
+
+    def __init__(self, *args, **kwargs):
+        """Creates the pool. Takes the arguments of `QueuePool`"""
+        super().__init__(*args, **kwargs)
+        self.__stats_lock = threading.Lock()
+        self.__checkouts = 0
+        self.__timeouts = 0
+        self.__invalidated = 0
+        self.__wait_time = 0.0
+        self.__max_wait_time = 0.0
+        event.listen(self, 'invalidate', self.__on_invalidate)
+
+    def connect(self):
+        """Checks out a connection, recording the time taken"""
+        start = time.perf_counter()
+        try:
+            connection = super().connect()
+        except PoolTimeoutError:
+            with self.__stats_lock:
+                self.__timeouts += 1
+            raise
+        wait_time = time.perf_counter() - start
+        with self.__stats_lock:
+            self.__checkouts += 1
+            self.__wait_time += wait_time
+            self.__max_wait_time = max(self.__max_wait_time, wait_time)
+        return connection
+
+    def stats(self):
+        """Returns the state of the pool and the checkout counters.
+
+        Returns
+        -------
+        dict
+            `pool_size`, `max_overflow`, `checked_in` (idle connections),
+            `checked_out`, `overflow` (connections open beyond the pool
+            size), `checkouts`, `timeouts`, `invalidated`,
+            `avg_wait_ms` and `max_wait_ms`.
+        """
+        with self.__stats_lock:
+            checkouts = self.__checkouts
+            return {
+                'pool_size': self.size(),
+                'max_overflow': self._max_overflow,
+                'checked_in': self.checkedin(),
+                'checked_out': self.checkedout(),
+                'overflow': max(self.overflow(), 0),
+                'checkouts': checkouts,
+                'timeouts': self.__timeouts,
+                'invalidated': self.__invalidated,
+                'avg_wait_ms': (self.__wait_time / checkouts * 1000
+                                if checkouts else 0.0),
+                'max_wait_ms': self.__max_wait_time * 1000,
+            }
+
+    def __on_invalidate(self, dbapi_connection, connection_record, exception):
+        """Counts the connections discarded as broken"""
+        with self.__stats_lock:
+            self.__invalidated += 1
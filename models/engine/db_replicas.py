@@ -0,0 +1,148 @@
+#!/usr/bin/python3
+
+"""Read replicas of the database storage engine.
+
+The replicas are given as a comma-separated list of database URLs in
+`MICHOTE_DB_REPLICA_URLS`. A replica whose connection fails is left out of
+the rotation for `MICHOTE_DB_REPLICA_RETRY` seconds (30 by default).
+"""
+
+import time
+import threading
+from os import getenv
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import scoped_session, sessionmaker
+from models.engine.db_pool import TimedQueuePool, engine_options
+
+
+class Replica():
+    """A read replica, with its engine and its thread-local sessions.
+
+    Attributes
+    ----------
+    url : sqlalchemy.engine.URL
+        The URL of the replica.
+    engine : sqlalchemy.engine.Engine
+        The engine connected to the replica.
+    session : scoped_session
+        The session of the current thread on the replica.
+    dropped_until : float
+        Time (`time.monotonic()`) until which the replica is out of the
+        rotation, or 0 if it is in the rotation.
+    failures : int
+        Number of times the replica was dropped.
+    """
+
+    def __init__(self, url):
+        """Creates the engine of a replica. No connection is opened.
+
+        Parameters
+        ----------
+        url : str
+            The URL of the replica.
+        """
+        self.url = make_url(url)
+        self.engine = create_engine(self.url, **engine_options(self.url))
+        self.session = scoped_session(sessionmaker(bind=self.engine,
+                                                   expire_on_commit=False))
+        self.dropped_until = 0
+        self.failures = 0
+
+
+class ReplicaSet():
+    """Replicas used in turn (round-robin) to serve reads.
+
+    Attributes
+    ----------
+    __replicas : list
+        The `Replica` objects.
+    __next : int
+        Index, among the replicas in the rotation, of the replica to be
+        tried first by the next read.
+    __retry : float
+        Number of seconds a failed replica stays out of the rotation.
+    __lock : threading.Lock
+        Guards `__next` and the rotation state of the replicas.
+    """
+
+    def __init__(self, urls):
+        """Creates the engines of the given replicas.
+
+        Parameters
+        ----------
+        urls : list
+            The URLs of the replicas.
+        """
+        self.__replicas = [Replica(url) for url in urls]
+        self.__next = 0
+        self.__retry = float(getenv('MICHOTE_DB_REPLICA_RETRY', 30))
+        self.__lock = threading.Lock()
+
+    def __bool__(self):
+        """Checks whether any replica is configured"""
+        return bool(self.__replicas)
+
+    def rotation(self):
+        """Returns the replicas in the rotation, in the order they should be
+        tried by the next read.
+
+        Each call starts one replica further, so consecutive reads are spread
+        over the replicas.
+
+        Returns
+        -------
+        list
+            The `Replica` objects that are not dropped.
+        """
+        now = time.monotonic()
+        with self.__lock:
+            replicas = [replica for replica in self.__replicas
+                        if replica.dropped_until <= now]
+            if not replicas:
+                return replicas
+            start = self.__next % len(replicas)
+            self.__next = start + 1
+            return replicas[start:] + replicas[:start]
+
+    def drop(self, replica):
+        """Leaves a failed replica out of the rotation for a while, and
+        discards the connections it holds.
+
+        Parameters
+        ----------
+        replica : Replica
+            The replica whose connection failed.
+        """
+        replica.session.remove()
+        replica.engine.dispose()
+        with self.__lock:
+            replica.dropped_until = time.monotonic() + self.__retry
+            replica.failures += 1
+
+    def remove(self):
+        """Closes the sessions of the current thread on every replica"""
+        for replica in self.__replicas:
+            replica.session.remove()
+
+    def stats(self):
+        """Returns the state of each replica.
+
+        Returns
+        -------
+        list
+            For each replica, its URL without the password, whether it is in
+            the rotation, the number of times it was dropped, and the
+            statistics of its connection pool (see `TimedQueuePool.stats()`).
+        """
+        now = time.monotonic()
+        stats = []
+        for replica in self.__replicas:
+            pool = replica.engine.pool
+            stats.append({
+                'url': replica.url.render_as_string(hide_password=True),
+                'in_rotation': replica.dropped_until <= now,
+                'failures': replica.failures,
+                **(pool.stats() if isinstance(pool, TimedQueuePool) else {}),
+            })
+        return stats
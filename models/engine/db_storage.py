@@ -2,17 +2,31 @@
 
 """Database storage engine for Michote."""
 
+import time
+import uuid
 import models
+import threading
+from datetime import datetime
 
 from os import getenv
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, func, or_, and_, inspect, update, \
+    delete
+from sqlalchemy.engine import make_url
+from sqlalchemy.dialects import mysql, sqlite
+from sqlalchemy.exc import InterfaceError, OperationalError
 from models.customer import Customer
 from models.partner import Partner
 from models.route import Route
 from models.admin import Admin
 from models.booked_trip import BookedTrip
-from models.base_model import Base
-from sqlalchemy.orm import scoped_session, sessionmaker
+from models.base_model import Base, BaseModel
+from models.engine.db_pool import TimedQueuePool, engine_options
+from models.engine.db_replicas import ReplicaSet
+from models.engine.reservations import ReservationStats
+from models.engine.sqlite_pragmas import apply_pragmas
+from models.engine.query import parse_criteria
+from models.engine.pagination import decode_cursor
+from sqlalchemy.orm import object_session, scoped_session, sessionmaker
 import urllib.parse
 
 class DB_Storage:
@@ -26,10 +40,39 @@ class DB_Storage:
     
     __engine : obj
         Holds the engine that interacts with the database.
-        The database in use is MySQL.
+        The database in use is MySQL. Its connection pool is configured by
+        the `MICHOTE_DB_*` environment variables (see `db_pool.py`).
     
     __session : obj
         Holds an instance of the current database session.
+
+    __yield_per : int
+        Number of rows fetched at a time by `iterate()`.
+
+    __replicas : ReplicaSet
+        The read replicas. `all()`, `get()`, `count()`, `filter()` and
+        `iterate()` are served by the replicas in turn, and by the primary
+        database when no replica is configured or available. `first()` and
+        `exists()`, used to check credentials and uniqueness before writes,
+        always query the primary database, as does `filter(primary=True)`.
+
+    __local : threading.local
+        Holds `wrote`, set once the current thread writes, so that its reads
+        are served by the primary database until the session is closed
+        (read-your-writes).
+
+    __reservations : ReservationStats
+        Counters of the seat reservations.
+
+    __reserve_retries : int
+        Number of times a seat reservation or release is retried when the
+        database reports a lock conflict, eg a deadlock or a lock wait
+        timeout.
+
+    __contended_wait : float
+        Seconds above which taking the seats of a route is counted as
+        contended: the row of the route, or the SQLite database, was locked
+        by another booking. Set by `MICHOTE_DB_CONTENDED_MS` (5 by default).
     
     MICHOTE_MYSQL_USER : str
     Username used to access the database
@@ -45,6 +88,13 @@ class DB_Storage:
 
     MICHOTE_ENV : str
         The database environment for the session. Can be `dev` or `test`
+
+    MICHOTE_DB_URL : str
+        The URL of the database, eg `sqlite:///michote.db`, used instead of
+        the `MICHOTE_MYSQL_*` variables when set.
+
+    MICHOTE_DB_REPLICA_URLS : str
+        Comma-separated URLs of the read replicas of the database.
     """
 
     __classes = {'Customer': Customer, 'Partner': Partner,
@@ -53,26 +103,55 @@ class DB_Storage:
 
     __engine = None
     __session = None
+    __yield_per = 500
+    __generation = 0
+    __reserve_retries = 3
 
-    def __init__(self):
+    def __init__(self, replica_urls=None, url=None):
         """Initialises a database storage object.
-        
+
+        Parameters
+        ----------
+        replica_urls : list, optional
+            The URLs of the read replicas. Read from `MICHOTE_DB_REPLICA_URLS`
+            when not given.
+        url : str, optional
+            The URL of the database. Read from `MICHOTE_DB_URL`, or built from
+            the `MICHOTE_MYSQL_*` variables, when not given. The pragmas of
+            `sqlite_pragmas.py` are set on the connections to SQLite
+            databases.
         """
         MICHOTE_MYSQL_USER = getenv('MICHOTE_MYSQL_USER')
         MICHOTE_MYSQL_PWD = getenv('MICHOTE_MYSQL_PWD')
         MICHOTE_MYSQL_HOST = getenv('MICHOTE_MYSQL_HOST')
         MICHOTE_MYSQL_DB = getenv('MICHOTE_MYSQL_DB')
         MICHOTE_ENV = getenv('MICHOTE_ENV')
-        
-        self.__engine = create_engine('mysql+mysqldb://{}:{}@{}/{}'.
-                                      format(MICHOTE_MYSQL_USER,
-                                             urllib.parse.quote_plus(MICHOTE_MYSQL_PWD),
-                                             MICHOTE_MYSQL_HOST,
-                                             MICHOTE_MYSQL_DB))
+        MICHOTE_DB_URL = url or getenv('MICHOTE_DB_URL')
+
+        if MICHOTE_DB_URL is None:
+            MICHOTE_DB_URL = 'mysql+mysqldb://{}:{}@{}/{}'.format(
+                MICHOTE_MYSQL_USER,
+                urllib.parse.quote_plus(MICHOTE_MYSQL_PWD),
+                MICHOTE_MYSQL_HOST,
+                MICHOTE_MYSQL_DB)
+        url = make_url(MICHOTE_DB_URL)
+        self.__engine = create_engine(url, **engine_options(url))
+        if url.get_backend_name() == 'sqlite':
+            apply_pragmas(self.__engine)
         if MICHOTE_ENV == 'test':
             Base.metadata.drop_all(self.__engine)
 
-    def all(self, cls=None):
+        if replica_urls is None:
+            replica_urls = [url.strip() for url in
+                            getenv('MICHOTE_DB_REPLICA_URLS', '').split(',')
+                            if url.strip()]
+        self.__replicas = ReplicaSet(replica_urls)
+        self.__local = threading.local()
+        self.__reservations = ReservationStats()
+        self.__contended_wait = float(
+            getenv('MICHOTE_DB_CONTENDED_MS', 5)) / 1000
+
+    def all(self, cls=None, limit=None, cursor=None):
         """Returns all the objects stored in the database.
 
         If class name is specified, only objects from that class are returned.
@@ -82,15 +161,28 @@ class DB_Storage:
         ----------
         cls : str, optional
             The class whose objects are to be returned
+        limit : int, optional
+            The maximum number of objects to return. When `limit` or `cursor`
+            is given, the objects are returned in `(created_at, id)` order
+            and `cls` is required.
+        cursor : str, optional
+            Cursor returned for the last object of the previous page. Only
+            objects after it are returned.
         """
-        objs_dict = {}
-        for clss in DB_Storage.__classes:
-            if cls is None or cls is DB_Storage.__classes[clss] or cls is clss:
-                objs = self.__session.query(DB_Storage.__classes[clss]).all()
-                for obj in objs:
-                    key = f'{obj.__class__.__name__}.{obj.id}'
-                    objs_dict[key] = obj
-        return objs_dict
+        if limit is not None or cursor is not None:
+            return self.filter(cls, limit=limit, cursor=cursor)
+
+        def read(session):
+            objs_dict = {}
+            for clss in DB_Storage.__classes:
+                if cls is None or cls is DB_Storage.__classes[clss] or \
+                   cls is clss:
+                    objs = session.query(DB_Storage.__classes[clss]).all()
+                    for obj in objs:
+                        key = f'{obj.__class__.__name__}.{obj.id}'
+                        objs_dict[key] = obj
+            return objs_dict
+        return self.__read(read)
 
     def new(self, obj):
         """Adds a new object to the current database session
@@ -100,11 +192,290 @@ class DB_Storage:
         obj : str
             The object to be added to storage.
         """
-        self.__session.add(obj)
+        self.__local.wrote = True
+        if obj.is_dirty or obj not in self.__session:
+            self.__attach(obj)
 
     def save(self):
-        """Commits all changes made in the current session to the db"""
+        """Commits all changes made in the current session to the db.
+
+        Only the columns of the attributes recorded as changed by the objects
+        are updated, since setting an attribute to its current value does not
+        change it. The written objects are then marked as clean.
+        """
+        self.__local.wrote = True
+        written = [obj for obj in (*self.__session.new, *self.__session.dirty)
+                   if isinstance(obj, BaseModel)]
         self.__session.commit()
+        for obj in written:
+            obj.mark_clean()
+        self.__generation += 1
+
+    def bulk_new(self, objs):
+        """Adds many objects and commits them in a single transaction.
+
+        The objects of each class are inserted with multi-row INSERT
+        statements, in batches. Nothing is written if any insert fails.
+
+        Parameters
+        ----------
+        objs : iterable
+            The objects to be added to storage.
+        """
+        self.__local.wrote = True
+        try:
+            for obj in objs:
+                self.__attach(obj)
+            self.save()
+        except Exception:
+            self.__session.rollback()
+            raise
+
+    def bulk_upsert(self, cls, rows):
+        """Creates or replaces many objects of a class from their dict
+        representations, in a single transaction.
+
+        A row whose `id` is the ID of an object in storage replaces that
+        object, keeping its `created_at`. Other rows are created, with a new
+        ID unless one is given. `last_updated` is set to the current time.
+
+        The rows are written with a single `INSERT ... ON DUPLICATE KEY
+        UPDATE` (MySQL) or `INSERT ... ON CONFLICT DO UPDATE` (SQLite)
+        statement run for all the rows at once. No object is built: the
+        column values are taken from the rows, with the attributes listed in
+        `__datetime_fields__` parsed from ISO format. The objects already
+        loaded in the current session are not refreshed.
+
+        Parameters
+        ----------
+        cls : class or str
+            The class of the objects.
+        rows : iterable
+            The attributes of each object, as dicts.
+
+        Returns
+        -------
+        list
+            The IDs of the objects, in the order of the rows.
+
+        Raises
+        ------
+        ValueError
+            If the class is not a storage class, or if a row has attributes
+            that are not columns of its table.
+        """
+        cls = DB_Storage.__classes.get(cls, cls)
+        if cls not in DB_Storage.__classes.values():
+            raise ValueError(f'Unknown class: {cls}')
+        table = cls.__table__
+        now = datetime.now()
+        defaults = {column.name: column.default.arg for column in table.columns
+                    if column.default is not None and column.default.is_scalar}
+        attributes = set(table.columns.keys()) | {'__class__'}
+        values = []
+        for position, row in enumerate(rows):
+            unknown = set(row) - attributes
+            if unknown:
+                raise ValueError(f'Row {position}: unknown attributes: '
+                                 f'{", ".join(sorted(unknown))}')
+            obj_values = {}
+            for column in table.columns:
+                value = row.get(column.name)
+                if value is None:
+                    value = defaults.get(column.name)
+                elif column.name in cls.__datetime_fields__ and \
+                     type(value) is str:
+                    value = datetime.fromisoformat(value)
+                obj_values[column.name] = value
+            obj_values['id'] = obj_values['id'] or str(uuid.uuid4())
+            obj_values['created_at'] = obj_values['created_at'] or now
+            obj_values['last_updated'] = now
+            values.append(obj_values)
+        if not values:
+            return []
+
+        updated = [column.name for column in table.columns
+                   if column.name not in ('id', 'created_at')]
+        dialect = self.__engine.dialect.name
+        if dialect == 'mysql':
+            statement = mysql.insert(table)
+            statement = statement.on_duplicate_key_update(
+                {name: statement.inserted[name] for name in updated})
+        elif dialect == 'sqlite':
+            statement = sqlite.insert(table)
+            statement = statement.on_conflict_do_update(
+                index_elements=[table.c.id],
+                set_={name: statement.excluded[name] for name in updated})
+        else:
+            statement = None
+
+        self.__local.wrote = True
+        try:
+            if statement is not None:
+                self.__session.execute(statement, values)
+            else:
+                for obj_values in values:
+                    existing = self.__session.get(cls, obj_values['id'])
+                    if existing is None:
+                        self.__session.add(cls(**obj_values))
+                        continue
+                    for name in updated:
+                        setattr(existing, name, obj_values[name])
+            self.save()
+        except Exception:
+            self.__session.rollback()
+            raise
+        return [obj_values['id'] for obj_values in values]
+
+    def reserve_seats(self, trip):
+        """Reserves the seats of a booked trip on its route and saves the
+        trip, unless the route has fewer seats available than booked.
+
+        The seats are taken with a single conditional
+        `UPDATE routes SET slots_available = slots_available - n
+        WHERE id = ... AND slots_available >= n`, in the transaction that
+        inserts the trip. The database checks and decrements the seats
+        atomically and holds the lock of the row only until the commit, so
+        concurrent bookings cannot overbook the route and bookings on other
+        routes do not wait for each other. The reservation is retried when
+        the database reports a lock conflict.
+
+        Parameters
+        ----------
+        trip : BookedTrip
+            The trip to be booked. `no_of_seats_booked` seats are taken from
+            the route whose ID is `route_id`.
+
+        Returns
+        -------
+        bool
+            True if the seats were reserved and the trip saved, False if the
+            route does not exist or has not enough seats available.
+
+        Raises
+        ------
+        ValueError
+            If the number of seats is not a positive integer.
+        """
+        seats = trip.no_of_seats_booked
+        if type(seats) is not int or seats < 1:
+            raise ValueError(f'Invalid number of seats: {seats}')
+        statement = update(Route).where(
+            Route.id == trip.route_id, Route.slots_available >= seats).values(
+                slots_available=Route.slots_available - seats)
+        waits = []
+
+        def take_seats():
+            start = time.perf_counter()
+            taken = self.__session.execute(statement).rowcount == 1
+            waits.append(time.perf_counter() - start)
+            if not taken:
+                self.__session.rollback()
+                return False
+            self.__attach(trip)
+            self.save()
+            return True
+
+        start = time.perf_counter()
+        reserved, retries = self.__retry_on_conflict(take_seats)
+        contended = retries > 0 or max(waits) > self.__contended_wait
+        self.__reservations.record(trip.route_id, seats, reserved,
+                                   time.perf_counter() - start,
+                                   contended, retries)
+        return reserved
+
+    def release_seats(self, trip):
+        """Deletes a booked trip and gives its seats back to its route.
+
+        The trip is deleted with `DELETE ... WHERE id = ...` and, if it was
+        still in the database, the seats are added back with
+        `UPDATE routes SET slots_available = slots_available + n`, in one
+        transaction, so that concurrent cancellations of the same trip give
+        its seats back only once. The release is retried when the database
+        reports a lock conflict.
+
+        Parameters
+        ----------
+        trip : BookedTrip
+            The trip to be cancelled.
+
+        Returns
+        -------
+        bool
+            True if the trip was deleted, False if it was not in the
+            database anymore.
+        """
+        seats = trip.no_of_seats_booked
+        if type(seats) is not int or seats < 0:
+            seats = 0
+
+        def give_back_seats():
+            deleted = self.__session.execute(
+                delete(BookedTrip).where(BookedTrip.id == trip.id)).rowcount
+            if deleted != 1:
+                self.__session.rollback()
+                return False
+            if seats:
+                self.__session.execute(update(Route).where(
+                    Route.id == trip.route_id).values(
+                        slots_available=Route.slots_available + seats))
+            self.save()
+            return True
+
+        released, _ = self.__retry_on_conflict(give_back_seats)
+        session = object_session(trip)
+        if session is not None:
+            session.expunge(trip)
+        if released:
+            self.__reservations.release(seats)
+        return released
+
+    def __retry_on_conflict(self, write):
+        """Runs a write on the primary database, retrying it when the
+        database reports a lock conflict (`OperationalError`), eg a deadlock,
+        a lock wait timeout or a locked SQLite database.
+
+        The transaction is rolled back after every failed attempt.
+
+        Parameters
+        ----------
+        write : function
+            Makes the write and commits it. Called without arguments.
+
+        Returns
+        -------
+        tuple
+            The value returned by `write` and the number of retries.
+        """
+        self.__local.wrote = True
+        retries = 0
+        while True:
+            try:
+                return write(), retries
+            except OperationalError:
+                self.__session.rollback()
+                if retries == self.__reserve_retries:
+                    raise
+                retries += 1
+            except Exception:
+                self.__session.rollback()
+                raise
+
+    def reservation_stats(self):
+        """Returns the counters of the seat reservations.
+
+        A reservation is counted as contended when taking the seats waited
+        for a lock held by another booking for more than
+        `MICHOTE_DB_CONTENDED_MS` milliseconds, or when the database reported
+        a lock conflict. The time spent waiting for the lock of the row of
+        the route is included in the reservation time.
+
+        Returns
+        -------
+        dict
+            See `ReservationStats.stats()`.
+        """
+        return self.__reservations.stats()
 
     def delete(self, obj=None):
         """Deletes the passed object from the database.
@@ -118,7 +489,8 @@ class DB_Storage:
         """
         if obj is None:
             return
-        self.__session.delete(obj)
+        self.__local.wrote = True
+        self.__session.delete(self.__attach(obj))
 
     def reload(self):
         """Reloads all objects from the database to the current session"""
@@ -128,11 +500,18 @@ class DB_Storage:
         self.__session = Session
 
     def close(self):
-        """Closes the current database session"""
+        """Closes the current database session, and the sessions on the
+        replicas. The following reads may be served by the replicas again.
+        """
         self.__session.remove()
+        self.__replicas.remove()
+        self.__local.wrote = False
 
     def get(self, cls, id):
         """Retrieves an object from storage based on its class name and ID.
+
+        The object is fetched by primary key, so it is served from the session's
+        identity map when it has already been loaded.
         
         Parameters
         ----------
@@ -149,17 +528,14 @@ class DB_Storage:
         if cls not in DB_Storage.__classes.values():
             return None
 
-        objs_dict = models.storage.all(cls)
-        for obj in objs_dict.values():
-            if (obj.id == id):
-                return obj
-
-        return None
+        return self.__read(lambda session: session.get(cls, id))
 
     def count(self, cls=None):
         """Counts the number of objects of a given class in storage.
 
         If no class name is given, all objects in storage are counted.
+        The counting is done by the database with `SELECT COUNT(*)`, so no
+        objects are loaded.
         
         Parameters
         ----------
@@ -171,4 +547,275 @@ class DB_Storage:
         int
             The total number of objects counted
         """
-        return len(self.all(cls))
+        def read(session):
+            total = 0
+            for clss in DB_Storage.__classes:
+                if cls is None or cls is DB_Storage.__classes[clss] or \
+                   cls == clss:
+                    total += session.query(
+                        func.count(DB_Storage.__classes[clss].id)).scalar()
+            return total
+        return self.__read(read)
+
+    def filter(self, cls, limit=None, cursor=None, primary=False,
+               **criteria):
+        """Returns the objects of the given class that match the criteria.
+
+        The criteria are compiled into the WHERE clause of the query.
+
+        Parameters
+        ----------
+        cls : class or str
+            The class whose objects are searched.
+        **criteria : dict
+            `<attribute>=<value>` for an exact match or
+            `<attribute>__iexact=<value>` for a case-insensitive match.
+        limit : int, optional
+            The maximum number of objects to return. When `limit` or `cursor`
+            is given, the objects are returned in `(created_at, id)` order
+            and `cls` is required.
+        cursor : str, optional
+            Cursor returned for the last object of the previous page. Only
+            objects after it are returned.
+        primary : bool, optional
+            If True, the objects are read from the primary database rather
+            than a replica, eg to check uniqueness before a write.
+
+        Returns
+        -------
+        dict
+            The matching objects with the key <class_name>.<id>
+        """
+        def read(session):
+            query = self.__query(cls, criteria, session)
+            if limit is not None or cursor is not None:
+                query = self.__paginate(query, cls, limit, cursor)
+            objs_dict = {}
+            for obj in query.all():
+                objs_dict[f'{obj.__class__.__name__}.{obj.id}'] = obj
+            return objs_dict
+        if primary:
+            return read(self.__session)
+        return self.__read(read)
+
+    def iterate(self, cls=None, limit=None, cursor=None, **criteria):
+        """Yields the objects of the given class that match the criteria one
+        at a time.
+
+        Unlike `filter()`, no dict of all the matching objects is built.
+        Rows are fetched from a server-side cursor `__yield_per` at a time.
+        A replica failing once the first rows are fetched is not retried:
+        the error is raised.
+
+        Parameters
+        ----------
+        cls : class or str, optional
+            The class whose objects are searched. All classes if None.
+        limit : int, optional
+            The maximum number of objects to yield. See `filter()`.
+        cursor : str, optional
+            Cursor returned for the last object of the previous page. See
+            `filter()`.
+        **criteria : dict
+            The criteria the objects must match. See `filter()`.
+        """
+        if cls is None:
+            if limit is not None or cursor is not None:
+                raise ValueError('A class is required to paginate objects')
+            for clss in DB_Storage.__classes.values():
+                yield from self.iterate(clss, **criteria)
+            return
+
+        def read(session):
+            query = self.__query(cls, criteria, session)
+            if limit is not None or cursor is not None:
+                query = self.__paginate(query, cls, limit, cursor)
+            rows = iter(query.yield_per(self.__yield_per))
+            # Fetches the first rows, so that a failed replica is detected
+            # before anything is yielded
+            return next(rows, None), rows
+
+        obj, rows = self.__read(read)
+        if obj is None:
+            return
+        yield obj
+        yield from rows
+
+    def first(self, cls, **criteria):
+        """Returns one object of the given class that matches the criteria.
+
+        Parameters
+        ----------
+        cls : class or str
+            The class whose objects are searched.
+        **criteria : dict
+            The criteria the object must match. See `filter()`.
+
+        Returns
+        -------
+        obj
+            A matching object, or None if no object matches.
+        """
+        return self.__query(cls, criteria).first()
+
+    def exists(self, cls, **criteria):
+        """Checks whether an object of the given class matches the criteria.
+
+        Parameters
+        ----------
+        cls : class or str
+            The class whose objects are searched.
+        **criteria : dict
+            The criteria the object must match. See `filter()`.
+
+        Returns
+        -------
+        bool
+            True if at least one object matches.
+        """
+        query = self.__query(cls, criteria)
+        return self.__session.query(query.exists()).scalar()
+
+    def pool_stats(self):
+        """Returns the statistics of the connection pool.
+
+        Returns
+        -------
+        dict
+            The number of connections checked out, idle and opened beyond
+            the pool size, and the number and duration of the checkouts.
+            See `TimedQueuePool.stats()`. Those statistics are left out
+            when the database does not use a queue of connections, eg for
+            in-memory SQLite databases. When read replicas are configured,
+            `replicas` holds the state of each one (see `ReplicaSet.stats()`).
+        """
+        pool = self.__engine.pool
+        stats = pool.stats() if isinstance(pool, TimedQueuePool) else {}
+        if self.__replicas:
+            stats['replicas'] = self.__replicas.stats()
+        return stats
+
+    def generation(self):
+        """Returns a number that changes every time changes are committed.
+
+        Used to invalidate data cached from storage.
+        """
+        return self.__generation
+
+    def __read(self, read):
+        """Runs a read on a replica, or on the primary database.
+
+        The replicas in the rotation are tried in turn. A replica whose
+        connection fails is dropped from the rotation and the next one is
+        tried, then the primary database. Reads made by a thread that wrote
+        since its session was last closed are run on the primary database.
+
+        Parameters
+        ----------
+        read : function
+            Takes a session and returns the result of the read.
+
+        Returns
+        -------
+        object
+            The value returned by `read`.
+        """
+        if self.__replicas and not getattr(self.__local, 'wrote', False):
+            for replica in self.__replicas.rotation():
+                try:
+                    return read(replica.session)
+                except (OperationalError, InterfaceError):
+                    self.__replicas.drop(replica)
+        return read(self.__session)
+
+    def __attach(self, obj):
+        """Moves an object loaded from a replica to the session of the
+        primary database, so that it can be written.
+
+        Parameters
+        ----------
+        obj : BaseModel
+            The object to be written.
+
+        Returns
+        -------
+        BaseModel
+            The object, or the copy of it held by the primary session when it
+            was already loaded there, with the changes of `obj` applied.
+        """
+        session = self.__session()
+        obj_session = object_session(obj)
+        if obj_session is session:
+            return obj
+        if obj_session is not None:
+            obj_session.expunge(obj)
+        key = inspect(obj).key
+        if key is not None and key in session.identity_map:
+            return session.merge(obj)
+        session.add(obj)
+        return obj
+
+    def __query(self, cls, criteria, session=None):
+        """Builds a query for the objects of a class matching the criteria.
+
+        MySQL compares strings using case-insensitive collations by default,
+        so `__iexact` is compiled to a plain comparison there, which lets the
+        database use indexes on the column.
+
+        Parameters
+        ----------
+        cls : class or str
+            The class whose objects are searched.
+        criteria : dict
+            The criteria passed to `filter()`.
+        session : Session, optional
+            The session running the query. Defaults to the session of the
+            primary database.
+
+        Raises
+        ------
+        ValueError
+            If no class is given.
+        """
+        if cls is None:
+            raise ValueError('A class is required to query objects')
+        cls = DB_Storage.__classes.get(cls, cls)
+        query = (self.__session if session is None else session).query(cls)
+        case_insensitive_db = self.__engine.dialect.name == 'mysql'
+        for attribute, operator, value in parse_criteria(criteria):
+            column = getattr(cls, attribute)
+            if operator == 'iexact' and not case_insensitive_db:
+                column = func.lower(column)
+            query = query.filter(column == value)
+        return query
+
+    def __paginate(self, query, cls, limit, cursor):
+        """Restricts a query to one page of objects in `(created_at, id)`
+        order, starting right after the cursor.
+
+        Parameters
+        ----------
+        query : Query
+            The query to be paginated.
+        cls : class or str
+            The class whose objects are paginated.
+        limit : int
+            The maximum number of objects in the page. No maximum if None.
+        cursor : str
+            The cursor of the previous page, or None for the first page.
+
+        Raises
+        ------
+        ValueError
+            If the cursor is not valid.
+        """
+        cls = DB_Storage.__classes.get(cls, cls)
+        query = query.order_by(cls.created_at, cls.id)
+        if cursor is not None:
+            created_at, obj_id = decode_cursor(cursor)
+            query = query.filter(or_(cls.created_at > created_at,
+                                     and_(cls.created_at == created_at,
+                                          cls.id > obj_id)))
+        if limit is not None:
+            query = query.limit(limit)
+        return query
@@ -0,0 +1,67 @@
+#!/usr/bin/python3
+
+"""JSON serialization backend shared by the storage engines and the API.
+
+orjson is used when it is installed. Otherwise, the standard library `json`
+module is used. Both backends serialize `datetime` objects in ISO format, the
+same format produced by `datetime.isoformat()`, and storage objects as their
+dict representation (`BaseModel._as_record()`).
+"""
+
+import json
+from datetime import date, datetime
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def encode_default(obj):
+    """Converts objects the JSON encoder does not support natively.
+
+    Can be passed as the `default` argument of `json.dumps()`.
+
+    Parameters
+    ----------
+    obj : object
+        The object to be converted.
+
+    Raises
+    ------
+    TypeError
+        If the object cannot be converted.
+    """
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if hasattr(obj, '_as_record'):
+        return obj._as_record()
+    raise TypeError(f'Object of type {obj.__class__.__name__} '
+                    'is not JSON serializable')
+
+
+if orjson is not None:
+    BACKEND = 'orjson'
+
+    def dumps_bytes(obj):
+        """Serializes an object to JSON encoded as UTF-8 bytes"""
+        return orjson.dumps(obj, default=encode_default)
+
+    def dumps(obj):
+        """Serializes an object to a JSON string"""
+        return orjson.dumps(obj, default=encode_default).decode('utf-8')
+
+    loads = orjson.loads
+else:
+    BACKEND = 'json'
+
+    def dumps_bytes(obj):
+        """Serializes an object to JSON encoded as UTF-8 bytes"""
+        return dumps(obj).encode('utf-8')
+
+    def dumps(obj):
+        """Serializes an object to a JSON string"""
+        return json.dumps(obj, default=encode_default, ensure_ascii=False,
+                          separators=(',', ':'))
+
+    loads = json.loads
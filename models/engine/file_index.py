@@ -0,0 +1,142 @@
+#!/usr/bin/python3
+
+"""In-memory secondary indexes used by the file storage engine."""
+
+from operator import attrgetter, itemgetter
+
+
+class HashIndex():
+    """Hash index over one or more attributes of the objects of a class.
+
+    Objects are grouped into buckets by the values of the indexed attributes.
+    String values are lower-cased, so the same index answers exact and
+    case-insensitive lookups. Callers are expected to check the objects
+    returned by `lookup()` against their exact criteria.
+
+    Objects that have not been built yet can be indexed by their dict
+    representation.
+
+    Attributes
+    ----------
+    attributes : tuple
+        Names of the indexed attributes.
+    __buckets : dict
+        Maps the attribute values (a single value for single-attribute
+        indexes, otherwise a tuple) to the objects, keyed by their storage
+        key, having those values.
+    __bucket_keys : dict
+        Maps the storage key of each indexed object to its bucket, so that
+        the object can be moved when its attributes change.
+    """
+
+    def __init__(self, attributes):
+        """Creates an empty index over the given attributes.
+
+        Parameters
+        ----------
+        attributes : tuple
+            Names of the attributes to be indexed.
+        """
+        self.attributes = tuple(attributes)
+        self.__buckets = {}
+        self.__bucket_keys = {}
+        self.__get_values = attrgetter(*self.attributes)
+        self.__get_items = itemgetter(*self.attributes)
+
+    def add(self, key, obj):
+        """Adds an object to the index, replacing any previous entry for it.
+
+        When the indexed attributes did not change, the entry is replaced in
+        place, so the size of the bucket does not change while other threads
+        may be iterating over it.
+
+        Parameters
+        ----------
+        key : str
+            The storage key of the object ie <class_name>.<id>
+        obj : object
+            The object to be indexed.
+        """
+        bucket_key = self.__bucket_key(self.__values_of(obj))
+        if key in self.__bucket_keys and \
+           self.__bucket_keys[key] != bucket_key:
+            self.remove(key)
+        self.__buckets.setdefault(bucket_key, {})[key] = obj
+        self.__bucket_keys[key] = bucket_key
+
+    def add_all(self, objs_dict):
+        """Adds many objects that are not indexed yet to the index.
+
+        Parameters
+        ----------
+        objs_dict : dict
+            The objects to be indexed, keyed by their storage key.
+        """
+        buckets = self.__buckets
+        bucket_keys = self.__bucket_keys
+        get_values = self.__values_of
+        bucket_key_of = self.__bucket_key
+        for key, obj in objs_dict.items():
+            bucket_key = bucket_key_of(get_values(obj))
+            bucket = buckets.get(bucket_key)
+            if bucket is None:
+                bucket = buckets[bucket_key] = {}
+            bucket[key] = obj
+            bucket_keys[key] = bucket_key
+
+    def remove(self, key):
+        """Removes an object from the index if it is indexed.
+
+        Parameters
+        ----------
+        key : str
+            The storage key of the object.
+        """
+        if key not in self.__bucket_keys:
+            return
+        bucket_key = self.__bucket_keys.pop(key)
+        bucket = self.__buckets[bucket_key]
+        del bucket[key]
+        if not bucket:
+            del self.__buckets[bucket_key]
+
+    def lookup(self, values):
+        """Returns the objects whose indexed attributes have the given values.
+
+        Parameters
+        ----------
+        values : list
+            The values of the indexed attributes, in the order of
+            `attributes`.
+
+        Returns
+        -------
+        dict
+            The candidate objects with their storage keys.
+        """
+        if len(self.attributes) == 1:
+            values = values[0]
+        else:
+            values = tuple(values)
+        return self.__buckets.get(self.__bucket_key(values), {})
+
+    def __values_of(self, obj):
+        """Returns the values of the indexed attributes of an object or of
+        its dict representation.
+        """
+        if type(obj) is not dict:
+            return self.__get_values(obj)
+        try:
+            return self.__get_items(obj)
+        except KeyError:
+            if len(self.attributes) == 1:
+                return None
+            return tuple(obj.get(attribute) for attribute in self.attributes)
+
+    @staticmethod
+    def __bucket_key(values):
+        """Builds the bucket key for a value or a tuple of attribute values"""
+        if type(values) is tuple:
+            return tuple(value.lower() if isinstance(value, str) else value
+                         for value in values)
+        return values.lower() if isinstance(values, str) else values
@@ -3,7 +3,13 @@
 """File storage engine for Michote"""
 
 import os
-import json
+import atexit
+import time
+import bisect
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from contextlib import nullcontext
 import models
 from models.base_model import BaseModel
 from models.admin import Admin
@@ -11,9 +17,88 @@ from models.booked_trip import BookedTrip
 from models.partner import Partner
 from models.customer import Customer
 from models.route import Route
+from models.engine import snapshot
+from models.engine.journal import Journal
+from models.engine.group_commit import GroupCommitter
+from models.engine.rwlock import ReadWriteLock
+from models.engine.process_lock import ProcessLock
+from models.engine.reservations import ReservationStats, RouteLocks
+from models.engine.loader import ObjectLoader
+from models.engine.query import parse_criteria, matches
+from models.engine.file_index import HashIndex
+from models.engine.pagination import order_key, decode_cursor
 
 class FileStorage():
     """Handles file storage engine
+
+    When the environment variable `MICHOTE_FILE_JOURNAL` is set to `1`, the
+    storage runs in journaled mode: `save()` appends only the objects that were
+    added, updated or deleted since the last save to an append-only journal
+    instead of rewriting the whole file. Once the journal grows past
+    `MICHOTE_JOURNAL_MAX_SIZE` bytes, it is compacted into the JSON file in a
+    background thread.
+
+    The environment variable `MICHOTE_FILE_FORMAT` selects the format the
+    JSON file is written in: `json` (the default) or `binary`, a more compact
+    format (see `models.engine.snapshot`). The format of the file is detected
+    when it is read.
+
+    The environment variable `MICHOTE_FILE_COMPRESSION` selects how the JSON
+    file is compressed: `none` (the default), `gzip` or `zstd` (which needs
+    the `zstandard` package). The compression of the file is detected when it
+    is read. Files are always written to a temporary file that then replaces
+    them, so a crash never leaves a partially written file behind.
+
+    Objects that are passed to `new()` without having changed (see
+    `BaseModel.is_dirty`) are not written again, and `save()` writes nothing
+    when no object was added, changed or deleted. In the json format, the
+    serialized form of each object is kept, so rewriting the file only
+    serializes the objects that changed since they were last written.
+
+    When the environment variable `MICHOTE_FILE_GROUP_COMMIT` is set to `1`,
+    `save()` does not write itself: it waits for a background thread that
+    merges the saves requested by concurrent threads within
+    `MICHOTE_FILE_COMMIT_WINDOW` milliseconds into a single write.
+
+    The environment variable `MICHOTE_FILE_FSYNC` sets when writes are flushed
+    to disk with `os.fsync`: `never` (the default, left to the operating
+    system), `batch` (every write, or every batch in group commit mode) or
+    `interval` (at most every `MICHOTE_FILE_FSYNC_INTERVAL` seconds).
+
+    When the environment variable `MICHOTE_FILE_SHARDED` is set to `1`, the
+    objects of each class are stored in a file of their own, named after the
+    class (eg `models.Route.json`). The file of a class is only loaded the
+    first time objects of that class are accessed, and saving only rewrites
+    the files of the classes whose objects were added, updated or deleted.
+
+    When the environment variable `MICHOTE_FILE_LAZY` is set to `1`, objects
+    are not built when the JSON file is loaded: their dict representations are
+    kept and an object is only built the first time it is returned by `all()`,
+    `get()`, `filter()`, `iterate()` or `first()`. At most
+    `MICHOTE_FILE_CACHE_SIZE` built objects are kept; the least recently used
+    ones are turned back into dict representations. Objects must therefore be
+    passed to `new()` (as `save()` does) after being changed, or the changes
+    may be lost when they are evicted.
+
+    The storage can be shared by the threads of a threaded server. Writers
+    (`new()`, `delete()`, `reload()` and the records picked up by `close()`)
+    are serialized by a reader/writer lock, and readers do not block each
+    other. `all()` returns a copy of the objects that is made once and shared
+    by all readers until the next write (copy-on-write), so iterating over it
+    is safe while other threads write. The dict it returns must not be
+    modified. `reload()` reads and builds the new objects before taking the
+    lock, so readers are only held up while the new objects are swapped in.
+
+    When the environment variable `MICHOTE_FILE_MULTIPROCESS` is set to `1`,
+    the files can be shared by several processes, eg the workers of a
+    pre-forking server. Writes are made under an advisory lock on
+    `models.json.lock`, after applying the changes written by the other
+    processes, and increment a generation counter held in that file. `close()`
+    only reads the counter when no other process wrote, and otherwise applies
+    only the records appended to the journal since (or reloads the files of
+    the classes that changed in sharded mode, or the JSON file otherwise).
+    Objects changed by this process and not saved yet are kept. Compactions
+    are made while the lock is held instead of in the background.
     
     Attributes
     ----------
@@ -21,26 +106,196 @@ class FileStorage():
         Path to the file storage
     
     __objects : dict
-        Will hold all the objects that are retreived from storage
+        Will hold all the objects that are retreived from storage. In lazy
+        mode, objects that have not been built yet are held as their dict
+        representation.
+
+    __objects_by_class : dict
+        The same objects as `__objects`, partitioned by class name. Used to
+        answer queries for a single class without scanning every object.
+
+    __indexes : dict
+        Maps each class name to the hash indexes declared by the class in its
+        `__indexes__` attribute. Built when objects are loaded, or the first
+        time the class is searched, and kept up to date as objects are added,
+        saved and deleted.
+
+    __orders : dict
+        Maps a class name to the sorted `(created_at, id)` pairs of its
+        objects. Built the first time the class is paginated and kept up to
+        date afterwards.
 
     __classes : dict
          All valid classes in the Michote app. This private dict is used for
         validation to ensure only objects of valid classes are created.  
+
+    __loadable_classes : dict
+        The classes whose objects can be loaded from the JSON file, by name.
+        Includes `BaseModel`, whose objects can be created from the command
+        line interpreter.
+
+    __loader : ObjectLoader
+        Builds objects from the dict representations read from storage.
+
+    __format : str
+        The format snapshots are written in. One of `snapshot.FORMATS`.
+
+    __compression : str
+        The compression snapshots are written with. One of
+        `snapshot.COMPRESSIONS`.
+
+    __journal : Journal
+        The append-only journal. `None` when journaling is disabled.
+
+    __pending : dict
+        Keys of objects changed since the last save. The value is `True` for
+        new or updated objects and `False` for deleted objects.
+
+    __pending_lock : threading.Lock
+        Guards `__pending`, which is taken over by the thread writing it.
+
+    __lock : threading.Lock
+        Held while writing to the files and while checking them for changes
+        made by other processes.
+
+    __group_commit : GroupCommitter
+        Merges concurrent saves into batches. `None` when group commit is
+        disabled.
+
+    __fsync : str
+        When writes are flushed to disk: `never`, `batch` or `interval`.
+
+    __unsynced : bool
+        True if writes were made since the files were last flushed to disk.
+
+    __sharded : bool
+        True when each class is stored in a file of its own.
+
+    __unloaded : set
+        Names of the classes whose file has not been loaded yet. Always empty
+        when sharding is disabled.
+
+    __journal_overlay : dict
+        Maps the name of a class that has not been loaded yet to the journal
+        records to be applied on top of its file once it is loaded: the dict
+        representation of each object, or `None` for deleted objects, by
+        storage key.
+
+    __unflushed : set
+        Names of the classes having records in the journal that are not in
+        their file yet. Only their files are written by compactions.
+
+    __serialized : dict
+        The serialized form of the objects last written to a file in the json
+        format, by storage key. `None` in the binary format and in lazy mode.
+        Changed under the read lock by `__serialize()`; entries are dropped
+        under the write lock when their object changes.
+
+    __cache : OrderedDict
+        Keys of the built objects, least recently used first. `None` when lazy
+        loading is disabled.
+
+    __rwlock : ReadWriteLock
+        Taken for reading by the methods that read `__objects` and the
+        structures derived from it, and for writing by the methods that
+        change them.
+
+    __derived_lock : threading.RLock
+        Guards the indexes and orders built by readers the first time a class
+        is searched or paginated, and the objects built in lazy mode.
+
+    __copies : dict
+        The copies of `__objects` (under the key `None`) and of the class
+        partitions returned by `all()`, by class name. A copy is dropped when
+        an object it holds is added or deleted. Not used in lazy mode.
+
+    __process_lock : ProcessLock
+        Excludes other processes while writing and holds the generation
+        counter shared by all processes. `None` unless
+        `MICHOTE_FILE_MULTIPROCESS` is set.
+
+    __seen_generation : int
+        The value of the shared generation counter once the changes written
+        by other processes were last applied.
+
+    __route_locks : RouteLocks
+        Serializes the seat reservations made on each route.
+
+    __reservations : ReservationStats
+        Counters of the seat reservations.
     """
 
     __file_path = 'models.json'
     __objects = {}
+    __objects_by_class = {}
+    __indexes = {}
+    __orders = {}
 
     __classes = {'Customer': Customer, 'Partner': Partner,
                  'BookedTrip': BookedTrip, 'Admin': Admin,
                  'Route': Route
     }
+    __loadable_classes = dict(__classes, BaseModel=BaseModel)
 
     def __init__(self):
         """Constructor"""
-        pass
+        self.__journal = None
+        self.__loader = ObjectLoader(self.__loadable_classes)
+        self.__format = os.getenv('MICHOTE_FILE_FORMAT', 'json')
+        if self.__format not in snapshot.FORMATS:
+            raise ValueError(f'Unknown MICHOTE_FILE_FORMAT: {self.__format}')
+        self.__compression = os.getenv('MICHOTE_FILE_COMPRESSION', 'none')
+        snapshot.check_compression(self.__compression)
+        if os.getenv('MICHOTE_FILE_JOURNAL') == '1':
+            self.__journal = Journal(self.__file_path + '.journal')
+        self.__sharded = os.getenv('MICHOTE_FILE_SHARDED') == '1'
+        self.__unloaded = set()
+        self.__journal_overlay = {}
+        self.__unflushed = set()
+        self.__journal_max_size = int(os.getenv('MICHOTE_JOURNAL_MAX_SIZE',
+                                                16 * 1024 * 1024))
+        self.__pending = {}
+        self.__pending_lock = threading.Lock()
+        self.__lock = threading.Lock()
+        self.__rwlock = ReadWriteLock()
+        self.__derived_lock = threading.RLock()
+        self.__copies = {}
+        self.__process_lock = None
+        if os.getenv('MICHOTE_FILE_MULTIPROCESS') == '1':
+            self.__process_lock = ProcessLock(self.__file_path + '.lock')
+        self.__seen_generation = None
+        self.__route_locks = RouteLocks()
+        self.__reservations = ReservationStats()
+        self.__compaction = None
+        self.__snapshot_signature = None
+        self.__journal_offset = 0
+        self.__generation = 0
+        self.__cache = None
+        if os.getenv('MICHOTE_FILE_LAZY') == '1':
+            self.__cache = OrderedDict()
+        self.__cache_size = int(os.getenv('MICHOTE_FILE_CACHE_SIZE', 10000))
+        self.__serialized = None
+        if self.__format == 'json' and self.__cache is None:
+            self.__serialized = {}
+        self.__fsync = os.getenv('MICHOTE_FILE_FSYNC', 'never')
+        if self.__fsync not in ('never', 'batch', 'interval'):
+            raise ValueError(f'Unknown MICHOTE_FILE_FSYNC: {self.__fsync}')
+        self.__fsync_interval = float(os.getenv('MICHOTE_FILE_FSYNC_INTERVAL',
+                                                1))
+        self.__next_sync = time.monotonic() + self.__fsync_interval
+        self.__unsynced = False
+        self.__group_commit = None
+        if os.getenv('MICHOTE_FILE_GROUP_COMMIT') == '1':
+            window = float(os.getenv('MICHOTE_FILE_COMMIT_WINDOW', 5)) / 1000
+            self.__group_commit = GroupCommitter(
+                self.__commit, window,
+                self.__sync if self.__fsync == 'interval' else None,
+                self.__fsync_interval)
+        atexit.register(self.__wait_for_compaction)
+        if self.__fsync == 'interval':
+            atexit.register(self.__sync)
 
-    def all(self, cls=None):
+    def all(self, cls=None, limit=None, cursor=None):
         """Returns the dict that contains all the objects that have been loaded
         from storage.
         
@@ -51,19 +306,29 @@ class FileStorage():
         ----------
         cls : str, optional
             The class name whose objects are to be returned.
+        limit : int, optional
+            The maximum number of objects to return. When `limit` or `cursor`
+            is given, the objects are returned in `(created_at, id)` order
+            and `cls` is required.
+        cursor : str, optional
+            Cursor returned for the last object of the previous page. Only
+            objects after it are returned.
 
         Returns
         -------
         dict
-            All objects that have been fetched from storage
+            All objects that have been fetched from storage. The dict is
+            shared with other callers and must not be modified.
         """
-        if cls == None:
-            return self.__objects
-        filtered_dict = {}
-        for key, value in self.__objects.items():
-            if cls == value.__class__ or cls == value.__class__.__name__:
-                filtered_dict[key] = value
-        return filtered_dict
+        self.__load(cls)
+        with self.__rwlock.read():
+            if limit is not None or cursor is not None:
+                return self.__page(cls, [], limit, cursor)
+            if self.__cache is None:
+                return self.__copy(cls)
+            if cls == None:
+                return self.__materialize_all(self.__objects)
+            return self.__materialize_all(self.__partition(cls))
 
     def new(self, obj):
         """Adds a new object to storage with the key <class_name>.<id>
@@ -74,31 +339,310 @@ class FileStorage():
             Object to be added to storage
         """
 
-        new_key = f'{obj.__class__.__name__}.{obj.id}'
-        self.__objects.update({new_key : obj})
+        with self.__rwlock.write():
+            self.__load(obj.__class__)
+            self.__put(obj)
+
+    def bulk_new(self, objs):
+        """Adds many objects to storage and writes them at once.
+
+        The objects are written by a single `save()`: in journaled mode,
+        they are appended to the journal as one batch, which is replayed as
+        a whole or not at all.
+
+        Parameters
+        ----------
+        objs : iterable
+            The objects to be added to storage.
+        """
+        objs = list(objs)
+        cls_names = {obj.__class__.__name__ for obj in objs}
+        with self.__rwlock.write():
+            for cls_name in cls_names:
+                self.__load(cls_name)
+                # Rebuilt by the next paginated query, which is cheaper than
+                # inserting each new object in order
+                self.__orders.pop(cls_name, None)
+            for obj in objs:
+                self.__put(obj)
+        self.save()
+
+    def bulk_upsert(self, cls, rows):
+        """Creates or replaces many objects of a class from their dict
+        representations, and writes them at once.
+
+        A row whose `id` is the ID of an object in storage replaces that
+        object, keeping its `created_at`. Other rows are created, with a new
+        ID unless one is given. `last_updated` is set to the current time.
+        The objects are written as by `bulk_new()`.
+
+        Parameters
+        ----------
+        cls : class or str
+            The class of the objects.
+        rows : iterable
+            The attributes of each object, as dicts.
+
+        Returns
+        -------
+        list
+            The IDs of the objects, in the order of the rows.
+
+        Raises
+        ------
+        ValueError
+            If the class is not a storage class, or if a row has attributes
+            that the class does not declare.
+        """
+        cls = FileStorage.__classes.get(cls, cls)
+        if cls not in FileStorage.__classes.values():
+            raise ValueError(f'Unknown class: {cls}')
+        attributes = FileStorage.__attributes(cls)
+        now = datetime.now()
+        objs = []
+        for position, row in enumerate(rows):
+            unknown = set(row) - attributes
+            if unknown:
+                raise ValueError(f'Row {position}: unknown attributes: '
+                                 f'{", ".join(sorted(unknown))}')
+            row = dict(row)
+            row.pop('__class__', None)
+            row.pop('last_updated', None)
+            existing = self.get(cls, row['id']) if row.get('id') else None
+            if existing is not None:
+                row['created_at'] = existing.created_at
+            elif type(row.get('created_at')) is str:
+                row['created_at'] = datetime.fromisoformat(row['created_at'])
+            obj = cls(**row)
+            obj.last_updated = now
+            objs.append(obj)
+        self.bulk_new(objs)
+        return [obj.id for obj in objs]
 
     def save(self):
         """Serializes objects in the dict variable to the JSON file
-        into the file given in the file path"""
+        into the file given in the file path.
+
+        In journaled mode, only the objects changed since the last save are
+        appended to the journal. In sharded mode, only the files of the
+        classes whose objects changed since the last save are written.
+        Nothing is written if no object changed.
 
-        lcl_copy = self.__objects
-        objects_as_dict = {key: lcl_copy[key].to_dict() for key in
-                           lcl_copy.keys()}
+        In group commit mode, the call blocks until the background thread
+        has written the changes. It returns right away when nothing changed
+        and no batch is being written, since a batch being written may hold
+        changes of the calling thread.
+        """
 
-        with open(self.__file_path, 'w', encoding='utf-8') as json_file:
-            json_file.write(json.dumps(objects_as_dict))
+        if not self.__pending and (self.__group_commit is None or
+                                   not self.__group_commit.busy()):
+            return
+        self.__generation += 1
+        if self.__group_commit is not None:
+            self.__group_commit.commit()
+            return
+        self.__commit()
+        if self.__fsync == 'interval' and time.monotonic() >= self.__next_sync:
+            self.__sync()
 
     def reload(self):
-        """Deserializes the objects from storage into the dict variable"""
+        """Deserializes the objects from storage into the dict variable.
+
+        In journaled mode, the journal is replayed on top of the objects
+        loaded from the JSON file.
+        The JSON file is read one object at a time and each object is built
+        as soon as it is read, so the content of the file is never held in
+        memory as a whole.
+        In sharded mode, no file is read: the file of each class is loaded
+        the first time the class is accessed. A JSON file holding all the
+        classes is split into one file per class if no such file exists yet.
+        Objects that are no longer in storage are dropped.
+
+        The files are read and the objects built before the write lock is
+        taken, so other threads keep reading the objects loaded so far until
+        the new ones are swapped in.
+        """
+        self.__wait_for_compaction()
+        with self.__lock:
+            self.__reload()
+
+    def __reload(self, keep=None):
+        """Loads the objects from storage again. See `reload()`.
+
+        Must be called with `__lock` held, so that the journal is neither
+        rotated nor appended to between the time it is replayed and the time
+        its offset is recorded.
+
+        Parameters
+        ----------
+        keep : set, optional
+            Keys of objects changed by this process whose current state is
+            kept instead of the one read from storage, along with the objects
+            that are waiting to be saved. When None, the objects waiting to be
+            saved are dropped as well.
+        """
+        if self.__process_lock is not None:
+            self.__seen_generation = self.__process_lock.generation()
+        if self.__sharded:
+            self.__split_snapshot()
+        signature = self.__stat_snapshot()
+        journal_offset = 0
+        overlay = {}
+        if self.__journal is not None:
+            records, journal_offset = self.__journal.replay()
+            for record in records:
+                overlay.setdefault(record['key'].partition('.')[0],
+                                   {})[record['key']] = record.get('obj')
+        partitions, indexes = {}, {}
+        if not self.__sharded:
+            changes = {}
+            for cls_overlay in overlay.values():
+                changes.update(cls_overlay)
+            partitions, indexes = self.__build(
+                self.__read_records(self.__file_path, changes))
+
+        with self.__rwlock.write():
+            kept = {}
+            if keep is not None:
+                kept = {key: self.__objects.get(key)
+                        for key in self.__kept_keys(keep)}
+            self.__objects.clear()
+            self.__objects_by_class.clear()
+            self.__indexes.clear()
+            self.__orders.clear()
+            if self.__cache is not None:
+                self.__cache.clear()
+            if self.__serialized is not None:
+                self.__serialized.clear()
+            self.__add_all(partitions, indexes)
+            if self.__sharded:
+                self.__unloaded = set(self.__loadable_classes)
+                self.__journal_overlay = overlay
+                self.__unflushed = set(overlay)
+            if keep is None:
+                with self.__pending_lock:
+                    self.__pending.clear()
+            self.__restore(kept)
+            self.__snapshot_signature = signature
+            self.__journal_offset = journal_offset
+            self.__generation += 1
+
+    def reserve_seats(self, trip):
+        """Reserves the seats of a booked trip on its route and saves the
+        trip, unless the route has fewer seats available than booked.
+
+        The seats available are checked and decremented while holding a
+        lock of the route, so that concurrent bookings can neither overbook
+        the route nor lose each other's updates, while bookings on other
+        routes go on. The lock is released before the trip is saved, so
+        that the saves of concurrent bookings can be merged in group commit
+        mode.
+
+        In multi-process mode, the seats are taken while holding the lock
+        shared by the processes, once the changes written by the other
+        processes are applied, and written before it is released.
+
+        Parameters
+        ----------
+        trip : BookedTrip
+            The trip to be booked. `no_of_seats_booked` seats are taken from
+            the route whose ID is `route_id`.
+
+        Returns
+        -------
+        bool
+            True if the seats were reserved and the trip saved, False if the
+            route does not exist or has not enough seats available.
+
+        Raises
+        ------
+        ValueError
+            If the number of seats is not a positive integer.
+        """
+        seats = trip.no_of_seats_booked
+        if type(seats) is not int or seats < 1:
+            raise ValueError(f'Invalid number of seats: {seats}')
+        reserved = False
+
+        def take_seats():
+            nonlocal reserved
+            route = self.get(Route, trip.route_id)
+            if route is None or (route.slots_available or 0) < seats:
+                return
+            route.slots_available -= seats
+            self.new(route)
+            self.new(trip)
+            reserved = True
 
-        dict_of_objects = {}
-        if os.path.exists(self.__file_path):
-            with open(self.__file_path, 'r', encoding='utf-8') as json_file:
-                dict_of_objects = json.loads(json_file.read())
+        start = time.perf_counter()
+        with self.__route_locks.hold(trip.route_id) as contended:
+            if self.__process_lock is None:
+                take_seats()
+            else:
+                self.__generation += 1
+                self.__commit(take_seats)
+        self.__reservations.record(trip.route_id, seats, reserved,
+                                   time.perf_counter() - start, contended)
+        if reserved and self.__process_lock is None:
+            self.save()
+        return reserved
 
-        for obj in dict_of_objects.values():
-            obj_to_add = eval(obj['__class__'])(**obj)
-            self.new(obj_to_add)
+    def release_seats(self, trip):
+        """Deletes a booked trip and gives its seats back to its route.
+
+        The trip is deleted and the seats added back while holding the lock
+        of the route, as in `reserve_seats()`, so that concurrent
+        cancellations of the same trip give its seats back only once.
+
+        Parameters
+        ----------
+        trip : BookedTrip
+            The trip to be cancelled.
+
+        Returns
+        -------
+        bool
+            True if the trip was deleted, False if it was not in storage
+            anymore.
+        """
+        seats = trip.no_of_seats_booked
+        if type(seats) is not int or seats < 0:
+            seats = 0
+        released = False
+
+        def give_back_seats():
+            nonlocal released
+            stored = self.get(BookedTrip, trip.id)
+            if stored is None:
+                return
+            self.delete(stored)
+            route = self.get(Route, trip.route_id)
+            if route is not None and seats:
+                route.slots_available = (route.slots_available or 0) + seats
+                self.new(route)
+            released = True
+
+        with self.__route_locks.hold(trip.route_id):
+            if self.__process_lock is None:
+                give_back_seats()
+            else:
+                self.__generation += 1
+                self.__commit(give_back_seats)
+        if released:
+            self.__reservations.release(seats)
+            if self.__process_lock is None:
+                self.save()
+        return released
+
+    def reservation_stats(self):
+        """Returns the counters of the seat reservations.
+
+        Returns
+        -------
+        dict
+            See `ReservationStats.stats()`.
+        """
+        return self.__reservations.stats()
 
     def delete(self, obj=None):
         """Delete object from __objects if it exists.
@@ -112,14 +656,43 @@ class FileStorage():
         """
         if obj == None:
             return
-        key = f'{obj.__class__.__name__}.{obj.id}'
-        if key in self.__objects:
-            del self.__objects[key]
-            print("!! Object DELETED !!")
+        with self.__rwlock.write():
+            self.__load(obj.__class__)
+            key = f'{obj.__class__.__name__}.{obj.id}'
+            if key not in self.__objects:
+                return
+            self.__discard(key)
+            with self.__pending_lock:
+                self.__pending[key] = False
+            if self.__cache is not None:
+                self.__cache.pop(key, None)
+        print("!! Object DELETED !!")
 
     def close(self):
-        """call reload() method for deserializing the JSON file to objects"""
-        self.reload()
+        """Picks up changes made to storage by other processes.
+
+        Nothing is read when neither the JSON file nor the journal changed
+        since they were last loaded or written by this process. Records
+        appended to the journal by other processes are applied incrementally.
+        When the JSON file itself changed, it is loaded again (only the files
+        of the classes that changed in sharded mode). Objects that were
+        passed to `new()` or `delete()` and not saved yet are kept as they
+        are.
+
+        In multi-process mode, only the shared generation counter is read
+        when no other process wrote to storage. The check runs under the
+        storage lock, so that threads of this process do not rotate or
+        append to the journal while it is replayed.
+        """
+        with self.__lock:
+            if self.__process_lock is not None:
+                generation = self.__process_lock.generation()
+                if generation == self.__seen_generation:
+                    return
+            if self.__refresh(set()):
+                self.__reload(set())
+            elif self.__process_lock is not None:
+                self.__seen_generation = generation
 
     def get(self, cls, id):
         """Retrieves an object from storage based on its class and ID.
@@ -137,21 +710,983 @@ class FileStorage():
         if cls not in FileStorage.__classes.values():
             return None
 
-        objs_dict = models.storage.all(cls)
-        for obj in objs_dict.values():
-            if (obj.id == id):
-                return obj
-
-        return None
+        self.__load(cls)
+        key = f'{cls.__name__}.{id}'
+        with self.__rwlock.read():
+            obj = self.__objects.get(key)
+            if obj is None:
+                return None
+            return self.__materialize(key, obj)
 
     def count(self, cls=None):
         """Counts the number of objects of a given class in storage.
 
-        If no class is provided, all objects in storage are retreived.
+        If no class is provided, all objects in storage are counted.
+        The count is the size of the class partition, so no objects are
+        scanned.
         
         Parameters
         ----------
         cls : str
             The class whose object is to be retreived.
         """
-        return len(self.all(cls))
+        self.__load(cls)
+        with self.__rwlock.read():
+            if cls == None:
+                return len(self.__objects)
+            return len(self.__partition(cls))
+
+    def filter(self, cls, limit=None, cursor=None, primary=False,
+               **criteria):
+        """Returns the objects of the given class that match the criteria.
+
+        When the criteria cover the attributes of one of the indexes declared
+        by the class, only the objects found in that index are checked.
+        Otherwise, all the objects of the class are checked.
+
+        Parameters
+        ----------
+        cls : class or str
+            The class whose objects are searched.
+        **criteria : dict
+            `<attribute>=<value>` for an exact match or
+            `<attribute>__iexact=<value>` for a case-insensitive match.
+        limit : int, optional
+            The maximum number of objects to return. When `limit` or `cursor`
+            is given, the objects are returned in `(created_at, id)` order
+            and `cls` is required.
+        cursor : str, optional
+            Cursor returned for the last object of the previous page. Only
+            objects after it are returned.
+        primary : bool, optional
+            Ignored. Accepted for compatibility with the database storage
+            engine, which then reads from its primary database.
+
+        Returns
+        -------
+        dict
+            The matching objects with the key <class_name>.<id>
+        """
+        conditions = parse_criteria(criteria)
+        self.__load(cls)
+        with self.__rwlock.read():
+            if limit is not None or cursor is not None:
+                return self.__page(cls, conditions, limit, cursor)
+            return {key: self.__materialize(key, obj) for key, obj in
+                    list(self.__candidates(cls, conditions).items())
+                    if matches(obj, conditions)}
+
+    def iterate(self, cls=None, limit=None, cursor=None, **criteria):
+        """Yields the objects of the given class that match the criteria one
+        at a time.
+
+        Unlike `filter()`, no dict of all the matching objects is built. The
+        objects that may match are listed when the iteration starts: objects
+        added later are not yielded.
+
+        Parameters
+        ----------
+        cls : class or str, optional
+            The class whose objects are searched. All classes if None.
+        limit : int, optional
+            The maximum number of objects to yield. See `filter()`.
+        cursor : str, optional
+            Cursor returned for the last object of the previous page. See
+            `filter()`.
+        **criteria : dict
+            The criteria the objects must match. See `filter()`.
+        """
+        conditions = parse_criteria(criteria)
+        self.__load(cls)
+        with self.__rwlock.read():
+            if limit is not None or cursor is not None:
+                page = self.__page(cls, conditions, limit, cursor)
+            elif cls is None:
+                items = list(self.__objects.items())
+            else:
+                items = list(self.__candidates(cls, conditions).items())
+        if limit is not None or cursor is not None:
+            yield from page.values()
+            return
+
+        for key, obj in items:
+            if not matches(obj, conditions):
+                continue
+            if self.__cache is not None:
+                with self.__rwlock.read():
+                    obj = self.__materialize(key, obj)
+            yield obj
+
+    def first(self, cls, **criteria):
+        """Returns one object of the given class that matches the criteria.
+
+        Parameters
+        ----------
+        cls : class or str
+            The class whose objects are searched.
+        **criteria : dict
+            The criteria the object must match. See `filter()`.
+
+        Returns
+        -------
+        obj
+            A matching object, or None if no object matches.
+        """
+        conditions = parse_criteria(criteria)
+        self.__load(cls)
+        with self.__rwlock.read():
+            for key, obj in self.__candidates(cls, conditions).items():
+                if matches(obj, conditions):
+                    return self.__materialize(key, obj)
+        return None
+
+    def exists(self, cls, **criteria):
+        """Checks whether an object of the given class matches the criteria.
+
+        Parameters
+        ----------
+        cls : class or str
+            The class whose objects are searched.
+        **criteria : dict
+            The criteria the object must match. See `filter()`.
+
+        Returns
+        -------
+        bool
+            True if at least one object matches.
+        """
+        return self.first(cls, **criteria) is not None
+
+    def generation(self):
+        """Returns a number that changes every time storage is written to or
+        reloaded.
+
+        Used to invalidate data cached from storage.
+        """
+        return self.__generation
+
+    def __put(self, obj):
+        """Adds a new or changed object to storage and records it as to be
+        written. Must be called with the write lock held and the class of the
+        object loaded.
+        """
+        key = f'{obj.__class__.__name__}.{obj.id}'
+        if not obj.is_dirty and self.__objects.get(key) is obj:
+            return
+        if self.__serialized is not None:
+            self.__serialized.pop(key, None)
+        self.__add(key, obj)
+        with self.__pending_lock:
+            self.__pending[key] = True
+        if self.__cache is not None:
+            self.__materialize(key, obj)
+
+    def __add(self, key, obj):
+        """Adds an object to `__objects`, to its class partition and to the
+        indexes of its class.
+        """
+        cls = self.__class_of(obj)
+        partition = self.__objects_by_class.setdefault(cls.__name__, {})
+        order = self.__orders.get(cls.__name__)
+        if order is not None and key not in partition:
+            bisect.insort(order, order_key(obj))
+        self.__objects[key] = obj
+        partition[key] = obj
+        for index in self.__indexes.get(cls.__name__, ()):
+            index.add(key, obj)
+        self.__copies.pop(None, None)
+        self.__copies.pop(cls.__name__, None)
+
+    def __build(self, records):
+        """Builds objects from their dict representations, partitioned by
+        class, and the indexes of their classes.
+
+        The objects are built by `__loader` and each class index is filled in
+        one pass. In lazy mode, the dict representations themselves are
+        partitioned, and the indexes of a class are only built the first time
+        the class is searched. Nothing is added to storage, so no lock is
+        needed.
+
+        Parameters
+        ----------
+        records : iterable
+            (storage key, dict representation) pairs of the objects, as
+            returned by `__read_records()`.
+
+        Returns
+        -------
+        tuple
+            The objects by storage key, by class name, and the indexes of
+            each class, by class name, to be passed to `__add_all()`.
+        """
+        if self.__cache is not None:
+            partitions = {}
+            for key, record in records:
+                partitions.setdefault(record['__class__'], {})[key] = record
+            return partitions, {}
+        partitions = self.__loader.build_all(records)
+        indexes = {cls_name: self.__build_indexes(
+                       self.__loadable_classes[cls_name], partition)
+                   for cls_name, partition in partitions.items()}
+        return partitions, indexes
+
+    @staticmethod
+    def __read_records(path, overlay):
+        """Reads a JSON file one object at a time, applying journal records
+        on top of it.
+
+        Each object is yielded as soon as it is read, so that it can be
+        built before the next one is read: the content of the file and the
+        dict representations of all its objects are never held in memory at
+        once.
+
+        Parameters
+        ----------
+        path : str
+            Path to the file. Nothing is read if it does not exist.
+        overlay : dict
+            The journal records to be applied: the dict representation of
+            each object, or `None` for deleted objects, by storage key.
+
+        Yields
+        ------
+        tuple
+            The storage key and the dict representation of each object.
+        """
+        remaining = dict(overlay)
+        if os.path.exists(path):
+            for key, record in snapshot.iter_records(path):
+                if key in remaining:
+                    record = remaining.pop(key)
+                    if record is None:
+                        continue
+                yield key, record
+        for key, record in remaining.items():
+            if record is not None:
+                yield key, record
+
+    def __add_all(self, partitions, indexes):
+        """Adds objects built by `__build()` to storage.
+
+        The objects become the partitions of classes that hold no objects
+        yet. Must be called with the write lock held.
+
+        Parameters
+        ----------
+        partitions : dict
+            The objects by storage key, by class name.
+        indexes : dict
+            The indexes of the classes, by class name. Classes without
+            indexes have theirs built the first time they are searched.
+        """
+        self.__objects_by_class.update(partitions)
+        for cls_name, partition in partitions.items():
+            self.__indexes.pop(cls_name, None)
+            self.__orders.pop(cls_name, None)
+            self.__objects.update(partition)
+            if cls_name in indexes:
+                self.__indexes[cls_name] = indexes[cls_name]
+        self.__copies.clear()
+
+    def __discard(self, key):
+        """Removes an object from `__objects`, from its class partition and
+        from the indexes of its class.
+        """
+        obj = self.__objects.pop(key, None)
+        if self.__serialized is not None:
+            self.__serialized.pop(key, None)
+        if obj is not None:
+            cls = self.__class_of(obj)
+            self.__partition(cls).pop(key, None)
+            for index in self.__indexes.get(cls.__name__, ()):
+                index.remove(key)
+            order = self.__orders.get(cls.__name__)
+            if order is not None:
+                position = bisect.bisect_left(order, order_key(obj))
+                if position < len(order) and order[position] == order_key(obj):
+                    del order[position]
+                else:
+                    del self.__orders[cls.__name__]
+            self.__copies.pop(None, None)
+            self.__copies.pop(cls.__name__, None)
+
+    def __load(self, cls=None):
+        """Loads the file of a class if it has not been loaded yet.
+
+        Takes the write lock, so it must not be called with the read lock
+        held.
+
+        Parameters
+        ----------
+        cls : class or str, optional
+            The class, or class name, to be loaded. All classes if None.
+        """
+        if not self.__unloaded:
+            return
+        if cls is None:
+            cls_names = list(self.__unloaded)
+        else:
+            cls_names = [cls if isinstance(cls, str) else cls.__name__]
+        for cls_name in cls_names:
+            if cls_name not in self.__unloaded:
+                continue
+            with self.__rwlock.write():
+                if cls_name not in self.__unloaded:
+                    continue
+                overlay = self.__journal_overlay.pop(cls_name, {})
+                self.__unloaded.discard(cls_name)
+                self.__add_all(*self.__build(self.__read_records(
+                    self.__shard_path(cls_name), overlay)))
+
+    def __shard_path(self, cls_name):
+        """Returns the path to the file of a class in sharded mode"""
+        root, extension = os.path.splitext(self.__file_path)
+        return f'{root}.{cls_name}{extension}'
+
+    def __split_snapshot(self):
+        """Splits a JSON file holding all the classes into one file per
+        class, unless the file of a class already exists.
+        """
+        shard_paths = [self.__shard_path(cls_name)
+                       for cls_name in self.__loadable_classes]
+        if not os.path.exists(self.__file_path) or \
+           any(os.path.exists(path) for path in shard_paths):
+            return
+        records_by_class = {cls_name: {} for cls_name in
+                            self.__loadable_classes}
+        for key, record in snapshot.iter_records(self.__file_path):
+            records_by_class[record['__class__']][key] = record
+        for cls_name, records in records_by_class.items():
+            snapshot.write(self.__shard_path(cls_name), records,
+                           self.__format, compression=self.__compression)
+
+    def __class_of(self, obj):
+        """Returns the class of an object or of its dict representation"""
+        if type(obj) is dict:
+            return self.__loadable_classes[obj['__class__']]
+        return obj.__class__
+
+    def __materialize(self, key, obj):
+        """Returns the object stored under the given key, building it first
+        if only its dict representation is held.
+
+        The object is marked as the most recently used one, and the least
+        recently used objects are evicted once more than
+        `MICHOTE_FILE_CACHE_SIZE` objects are built. Does nothing when lazy
+        loading is disabled.
+
+        Must be called with the read or the write lock held.
+
+        Parameters
+        ----------
+        key : str
+            The storage key of the object.
+        obj : object
+            The object, or its dict representation, stored under `key`.
+        """
+        cache = self.__cache
+        if cache is None:
+            return obj
+        with self.__derived_lock:
+            stored = self.__objects.get(key)
+            if stored is None:
+                # Deleted since `obj` was read: it is built but not kept.
+                if type(obj) is dict:
+                    return self.__loader.build(dict(obj))
+                return obj
+            obj = stored
+            if type(obj) is dict:
+                obj = self.__loader.build(dict(obj))
+                self.__replace(key, obj)
+            cache[key] = None
+            cache.move_to_end(key)
+            while len(cache) > self.__cache_size:
+                evicted_key, _ = cache.popitem(last=False)
+                evicted = self.__objects.get(evicted_key)
+                if evicted is not None and type(evicted) is not dict:
+                    self.__replace(evicted_key, evicted._as_record())
+            return obj
+
+    def __materialize_all(self, objs):
+        """Returns a copy of a dict of objects with every object built.
+
+        Parameters
+        ----------
+        objs : dict
+            Objects, or their dict representations, by storage key.
+        """
+        return {key: self.__materialize(key, obj)
+                for key, obj in list(objs.items())}
+
+    def __copy(self, cls=None):
+        """Returns the copy of `__objects`, or of a class partition, shared
+        by the callers of `all()` until the next write.
+
+        Must be called with the read lock held.
+
+        Parameters
+        ----------
+        cls : class or str, optional
+            The class, or class name, whose objects are to be returned. All
+            objects if None.
+        """
+        if cls is not None and not isinstance(cls, str):
+            cls = cls.__name__
+        copy = self.__copies.get(cls)
+        if copy is None:
+            objs = self.__objects if cls is None else self.__partition(cls)
+            copy = self.__copies[cls] = dict(objs)
+        return copy
+
+    def __replace(self, key, obj):
+        """Swaps the value held for an object for its built object or its
+        dict representation, which have the same class and attributes.
+        """
+        cls = self.__class_of(obj)
+        self.__objects[key] = obj
+        self.__partition(cls)[key] = obj
+        for index in self.__indexes.get(cls.__name__, ()):
+            index.add(key, obj)
+
+    def __page(self, cls, conditions, limit, cursor):
+        """Returns one page of the objects of a class matching the conditions.
+
+        Objects are returned in `(created_at, id)` order, starting right after
+        the cursor.
+
+        Parameters
+        ----------
+        cls : class or str
+            The class whose objects are paginated.
+        conditions : list
+            (attribute, operator, value) triples returned by
+            `parse_criteria()`.
+        limit : int
+            The maximum number of objects in the page. No maximum if None.
+        cursor : str
+            The cursor of the previous page, or None for the first page.
+
+        Raises
+        ------
+        ValueError
+            If no class is given or the cursor is not valid.
+        """
+        if cls is None:
+            raise ValueError('A class is required to paginate objects')
+        cls_name = cls if isinstance(cls, str) else cls.__name__
+        partition = self.__partition(cls)
+        candidates = self.__candidates(cls, conditions)
+        if candidates is partition:
+            order = self.__orders.get(cls_name)
+            if order is None:
+                with self.__derived_lock:
+                    order = self.__orders.get(cls_name)
+                    if order is None:
+                        order = sorted(order_key(obj)
+                                       for obj in list(partition.values()))
+                        self.__orders[cls_name] = order
+        else:
+            order = sorted(order_key(obj)
+                           for obj in list(candidates.values()))
+
+        start = 0
+        if cursor is not None:
+            start = bisect.bisect_right(order, decode_cursor(cursor))
+        page = {}
+        for position in range(start, len(order)):
+            if limit is not None and len(page) >= limit:
+                break
+            key = f'{cls_name}.{order[position][1]}'
+            obj = candidates.get(key)
+            if obj is not None and matches(obj, conditions):
+                page[key] = obj
+        return self.__materialize_all(page)
+
+    def __class_indexes(self, cls):
+        """Returns the hash indexes of a class, building them from the
+        objects of the class if needed.
+
+        Parameters
+        ----------
+        cls : class
+            The class whose indexes are to be returned.
+        """
+        indexes = self.__indexes.get(cls.__name__)
+        if indexes is None:
+            with self.__derived_lock:
+                indexes = self.__indexes.get(cls.__name__)
+                if indexes is None:
+                    indexes = self.__build_indexes(cls,
+                                                   self.__partition(cls))
+                    self.__indexes[cls.__name__] = indexes
+        return indexes
+
+    @staticmethod
+    def __build_indexes(cls, objs):
+        """Builds the hash indexes declared by a class over its objects.
+
+        Parameters
+        ----------
+        cls : class
+            The class whose indexes are to be built.
+        objs : dict
+            The objects of the class, by storage key.
+        """
+        indexes = [HashIndex(attributes)
+                   for attributes in getattr(cls, '__indexes__', ())]
+        for index in indexes:
+            index.add_all(objs)
+        return indexes
+
+    def __candidates(self, cls, conditions):
+        """Returns the objects that may match the given conditions.
+
+        Uses the index of the class that covers the most conditions. If no
+        index covers the conditions, all the objects of the class are
+        returned.
+
+        Parameters
+        ----------
+        cls : class or str
+            The class whose objects are searched.
+        conditions : list
+            (attribute, operator, value) triples returned by
+            `parse_criteria()`.
+        """
+        cls_name = cls if isinstance(cls, str) else cls.__name__
+        if not conditions or cls_name not in self.__loadable_classes:
+            return self.__partition(cls)
+        values = {attribute: value for attribute, _, value in conditions}
+        best_index = None
+        for index in self.__class_indexes(self.__loadable_classes[cls_name]):
+            if all(attribute in values for attribute in index.attributes) and \
+               (best_index is None or
+                len(index.attributes) > len(best_index.attributes)):
+                best_index = index
+        if best_index is None:
+            return self.__partition(cls)
+        return best_index.lookup([values[attribute]
+                                  for attribute in best_index.attributes])
+
+    def __stat_snapshot(self):
+        """Returns the modification time, size and inode of the JSON file.
+
+        Used to detect whether the file changed since it was last read or
+        written. Returns `None` if the file does not exist. In sharded mode,
+        a tuple holding the result for the file of each class is returned.
+        """
+        if self.__sharded:
+            return tuple(self.__stat_file(self.__shard_path(cls_name))
+                         for cls_name in self.__loadable_classes)
+        return self.__stat_file(self.__file_path)
+
+    @staticmethod
+    def __stat_file(path):
+        """Returns the modification time, size and inode of a file, or
+        `None` if the file does not exist.
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def __partition(self, cls):
+        """Returns the dict holding the objects of the given class.
+
+        Parameters
+        ----------
+        cls : class or str
+            The class, or class name, whose objects are to be returned.
+        """
+        cls_name = cls if isinstance(cls, str) else cls.__name__
+        return self.__objects_by_class.get(cls_name, {})
+
+    def __refresh(self, keep):
+        """Applies the changes written by other processes since the files
+        were last read or written by this process.
+
+        Must be called with `__lock` held.
+
+        Parameters
+        ----------
+        keep : set
+            Keys of objects changed by this process whose current state is
+            kept. See `__reload()`.
+
+        Returns
+        -------
+        bool
+            True if the changes could not be applied incrementally and the
+            files must be loaded again with `__reload()`.
+        """
+        signature = self.__stat_snapshot()
+        if signature != self.__snapshot_signature and not self.__compacting():
+            if self.__sharded and self.__journal is None and \
+               self.__snapshot_signature is not None:
+                self.__refresh_shards(signature, keep)
+                return False
+            return True
+        if self.__journal is None:
+            return False
+        journal_size = self.__journal.size()
+        if journal_size < self.__journal_offset:
+            return True
+        if journal_size > self.__journal_offset:
+            self.__replay_journal(keep)
+        return False
+
+    def __refresh_shards(self, signature, keep):
+        """Drops the objects of the classes whose file changed, so that the
+        file is loaded again the next time the class is accessed.
+
+        Parameters
+        ----------
+        signature : tuple
+            The current result of `__stat_snapshot()`.
+        keep : set
+            Keys of objects changed by this process whose current state is
+            kept. See `__reload()`.
+        """
+        stale = {cls_name for cls_name, old, new in
+                 zip(self.__loadable_classes, self.__snapshot_signature,
+                     signature) if old != new}
+        with self.__rwlock.write():
+            kept = {key: self.__objects.get(key)
+                    for key in self.__kept_keys(keep)
+                    if key.partition('.')[0] in stale}
+            for cls_name in stale:
+                for key in self.__objects_by_class.pop(cls_name, {}):
+                    del self.__objects[key]
+                    if self.__cache is not None:
+                        self.__cache.pop(key, None)
+                    if self.__serialized is not None:
+                        self.__serialized.pop(key, None)
+                self.__indexes.pop(cls_name, None)
+                self.__orders.pop(cls_name, None)
+                self.__unloaded.add(cls_name)
+            self.__copies.clear()
+            self.__restore(kept)
+            self.__snapshot_signature = signature
+            self.__generation += 1
+
+    def __kept_keys(self, keep):
+        """Returns the given keys along with the keys of the objects waiting
+        to be saved.
+        """
+        with self.__pending_lock:
+            return set(keep).union(self.__pending)
+
+    def __restore(self, kept):
+        """Puts back objects changed by this process after the objects of
+        their class were loaded again. Must be called with the write lock
+        held.
+
+        Parameters
+        ----------
+        kept : dict
+            The objects, or `None` for deleted objects, by storage key.
+        """
+        for key, obj in kept.items():
+            self.__load(key.partition('.')[0])
+            if obj is None:
+                self.__discard(key)
+            else:
+                self.__add(key, obj)
+
+    def __replay_journal(self, keep=()):
+        """Applies the records appended to the journal by other processes
+        since it was last read or written.
+
+        Parameters
+        ----------
+        keep : set, optional
+            Keys of objects changed by this process whose current state is
+            kept. See `__reload()`.
+        """
+        records, self.__journal_offset = \
+            self.__journal.replay(self.__journal_offset)
+        with self.__rwlock.write():
+            kept = self.__kept_keys(keep)
+            for record in records:
+                cls_name = record['key'].partition('.')[0]
+                if self.__sharded:
+                    self.__unflushed.add(cls_name)
+                if record['key'] in kept:
+                    continue
+                if cls_name in self.__unloaded:
+                    self.__journal_overlay.setdefault(
+                        cls_name, {})[record['key']] = record.get('obj')
+                    continue
+                if self.__cache is not None:
+                    self.__cache.pop(record['key'], None)
+                if self.__serialized is not None:
+                    self.__serialized.pop(record['key'], None)
+                if record['op'] == 'put' and self.__cache is not None:
+                    self.__add(record['key'], record['obj'])
+                elif record['op'] == 'put':
+                    self.__add(record['key'],
+                               self.__loader.build(record['obj']))
+                else:
+                    self.__discard(record['key'])
+            self.__generation += 1
+
+    def __commit(self, hold=None):
+        """Writes the objects changed since the last commit.
+
+        Called by `save()`, or by the background thread once per batch in
+        group commit mode.
+
+        Parameters
+        ----------
+        hold : function, optional
+            Called without arguments while the files are locked, once the
+            changes written by other processes are applied. The objects it
+            passes to `new()` or `delete()` are written as well.
+        """
+        with self.__pending_lock:
+            pending, self.__pending = self.__pending, {}
+        if not pending and hold is None:
+            return
+        sync = self.__fsync == 'batch'
+        with self.__lock, self.__process_lock or nullcontext():
+            if self.__process_lock is not None and \
+               self.__process_lock.generation() != self.__seen_generation and \
+               self.__refresh(set(pending)):
+                self.__reload(set(pending))
+            if hold is not None:
+                hold()
+                with self.__pending_lock:
+                    pending.update(self.__pending)
+                    self.__pending = {}
+                if not pending:
+                    return
+            if self.__journal is not None:
+                self.__save_to_journal(pending, sync)
+            else:
+                cls_names = {key.partition('.')[0] for key in pending}
+                with self.__rwlock.read():
+                    written = [self.__objects.get(key) for key in pending]
+                    snapshot_items = self.__snapshot_items(cls_names)
+                self.__write_snapshots(snapshot_items, sync)
+                self.__snapshot_signature = self.__stat_snapshot()
+                self.__mark_clean(written)
+            if self.__process_lock is not None:
+                self.__seen_generation = self.__process_lock.increment()
+            self.__unsynced = not sync
+
+    def __sync(self):
+        """Flushes the writes made since the last flush to disk"""
+        self.__next_sync = time.monotonic() + self.__fsync_interval
+        with self.__lock:
+            if not self.__unsynced:
+                return
+            self.__unsynced = False
+        if self.__journal is not None:
+            self.__journal.sync()
+        elif self.__sharded:
+            for cls_name in self.__loadable_classes:
+                snapshot.sync_file(self.__shard_path(cls_name))
+        else:
+            snapshot.sync_file(self.__file_path)
+
+    def __save_to_journal(self, pending, sync):
+        """Appends the objects changed since the last save to the journal.
+
+        Starts a background compaction when the journal grows past the size
+        limit, or compacts the journal right away in multi-process mode. Must
+        be called with `__lock` held.
+
+        Parameters
+        ----------
+        pending : dict
+            The keys of the changed objects. See `__pending`.
+        sync : bool
+            If True, the journal is flushed to disk.
+        """
+        records = []
+        written = []
+        with self.__rwlock.read():
+            for key, is_put in pending.items():
+                if self.__sharded:
+                    self.__unflushed.add(key.partition('.')[0])
+                obj = self.__objects.get(key) if is_put else None
+                if obj is not None:
+                    records.append({'op': 'put', 'key': key,
+                                    'obj': self.__as_record(obj)})
+                    written.append(obj)
+                else:
+                    records.append({'op': 'del', 'key': key})
+        journal_size = self.__journal.append(records, sync)
+        self.__journal_offset = journal_size
+        self.__mark_clean(written)
+
+        if journal_size > self.__journal_max_size and \
+           self.__process_lock is not None:
+            for cls_name in self.__unflushed:
+                self.__load(cls_name)
+            with self.__rwlock.read():
+                snapshot_items = self.__snapshot_items(self.__unflushed)
+            self.__unflushed = set()
+            self.__write_snapshots(snapshot_items, self.__fsync != 'never')
+            self.__journal.clear()
+            self.__journal_offset = 0
+            self.__snapshot_signature = self.__stat_snapshot()
+        elif journal_size > self.__journal_max_size and \
+           (self.__compaction is None or not self.__compaction.is_alive()):
+            self.__journal.rotate()
+            self.__journal_offset = 0
+            for cls_name in self.__unflushed:
+                self.__load(cls_name)
+            with self.__rwlock.read():
+                snapshot_items = self.__snapshot_items(self.__unflushed)
+            self.__unflushed = set()
+            compaction = threading.Thread(
+                target=self.__compact, args=(snapshot_items,), daemon=True)
+            compaction.start()
+            self.__compaction = compaction
+
+    def __compact(self, snapshot_items):
+        """Writes a new snapshot and discards the rotated journal.
+
+        Runs in a background thread. Records appended to the journal while the
+        snapshot is being written are kept in the active journal and replayed
+        on top of the new snapshot.
+
+        Parameters
+        ----------
+        snapshot_items : dict
+            Maps the path of each file to be written to the (key, object)
+            pairs of its objects at the time the journal was rotated.
+        """
+        self.__write_snapshots(snapshot_items, self.__fsync != 'never')
+        with self.__lock:
+            self.__snapshot_signature = self.__stat_snapshot()
+            self.__journal.discard_rotated()
+
+    def __compacting(self):
+        """Checks whether a background compaction is running. The files it
+        writes are not changes made by other processes: it records their
+        signature itself once they are written.
+        """
+        return self.__compaction is not None and self.__compaction.is_alive()
+
+    def __wait_for_compaction(self):
+        """Blocks until a running background compaction has finished"""
+        if self.__compaction is not None:
+            self.__compaction.join()
+
+    def __snapshot_items(self, cls_names):
+        """Returns the objects to be written to each file.
+
+        Must be called with the read lock held.
+
+        Parameters
+        ----------
+        cls_names : set
+            Names of the classes whose file is to be written in sharded mode.
+            Ignored otherwise: all the objects are written to the JSON file.
+
+        Returns
+        -------
+        dict
+            Maps the path of each file to the (key, object) pairs of its
+            objects.
+        """
+        if not self.__sharded:
+            return {self.__file_path: list(self.__objects.items())}
+        return {self.__shard_path(cls_name):
+                list(self.__partition(cls_name).items())
+                for cls_name in cls_names}
+
+    def __write_snapshots(self, snapshot_items, sync=False):
+        """Writes the given objects to their files in the configured format.
+
+        Parameters
+        ----------
+        snapshot_items : dict
+            Maps the path of each file to the (key, object) pairs of the
+            objects to be written to it.
+        sync : bool, optional
+            If True, the files are flushed to disk.
+        """
+        for path, items in snapshot_items.items():
+            if self.__serialized is not None:
+                snapshot.write_bytes(path, snapshot.join_records(
+                    self.__serialize(items)), sync, self.__compression)
+                continue
+            objects_as_dict = {key: self.__as_record(obj)
+                               for key, obj in items}
+            snapshot.write(path, objects_as_dict, self.__format, sync,
+                           self.__compression)
+
+    def __serialize(self, items):
+        """Returns the serialized form of objects for the json format.
+
+        The serialized form kept from the last write of an object is reused
+        unless the object changed since.
+
+        Objects are serialized without holding the read lock, so an object
+        may be changed, and its serialized form dropped by `new()`, while it
+        is being serialized. The serialized forms to be built are first
+        replaced by a marker, which `new()` drops as well, and a new
+        serialized form is only kept if its marker is still in place.
+
+        Parameters
+        ----------
+        items : list
+            (key, object) pairs of the objects to be serialized.
+        """
+        serialized = self.__serialized
+        marker = object()
+        with self.__rwlock.read():
+            encoded_records = []
+            for key, obj in items:
+                encoded = serialized.get(key)
+                if type(encoded) is not bytes or obj.is_dirty:
+                    serialized[key] = marker
+                    encoded = None
+                encoded_records.append(encoded)
+        fresh = []
+        for position, (key, obj) in enumerate(items):
+            if encoded_records[position] is None:
+                encoded = snapshot.dumps_record(key, obj._as_record())
+                encoded_records[position] = encoded
+                fresh.append((key, encoded))
+        with self.__rwlock.read():
+            for key, encoded in fresh:
+                if serialized.get(key) is marker:
+                    serialized[key] = encoded
+        return encoded_records
+
+    @staticmethod
+    def __attributes(cls):
+        """Returns the names of the attributes declared by a class: the
+        public class attributes holding default values, the attributes of
+        `BaseModel` and `__class__`, as found in dict representations.
+        """
+        attributes = {'__class__', 'id', 'created_at', 'last_updated'}
+        for klass in cls.__mro__:
+            attributes.update(
+                name for name, value in vars(klass).items()
+                if name[0] != '_' and not callable(value) and
+                not isinstance(value, property))
+        return attributes
+
+    @staticmethod
+    def __mark_clean(objs):
+        """Marks written objects as clean. Dict representations held in
+        lazy mode and deleted objects (`None`) are skipped.
+        """
+        for obj in objs:
+            if obj is not None and type(obj) is not dict:
+                obj.mark_clean()
+
+    @staticmethod
+    def __as_record(obj):
+        """Returns the dict representation of an object. Dict representations
+        held in lazy mode are returned as they are.
+        """
+        if type(obj) is dict:
+            return obj
+        return obj._as_record()
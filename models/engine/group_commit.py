@@ -0,0 +1,148 @@
+#!/usr/bin/python3
+
+"""Group commit for the file storage engine.
+
+Writers do not write to disk themselves: they ask a background thread for a
+commit and wait for it. The thread waits for a short window so that the
+commits requested by concurrent writers are merged, then writes all their
+changes at once and releases every writer of the batch together.
+"""
+
+import os
+import time
+import threading
+
+
+class GroupCommitter():
+    """Merges the commits requested by concurrent threads into batches.
+
+    Attributes
+    ----------
+    __flush : callable
+        Writes all the pending changes. Called from the background thread,
+        once per batch.
+    __sync : callable
+        Makes the changes written by `__flush` durable. Called from the
+        background thread every `__sync_interval` seconds. `None` when
+        `__flush` takes care of durability.
+    __window : float
+        Seconds to wait for more commits after the first commit of a batch.
+    __sync_interval : float
+        Seconds between two calls to `__sync`.
+    __waiters : list
+        The commits requested since the last batch was taken. Each one is a
+        `[event, error]` pair: the event is set once the batch is written and
+        the error is the exception raised while writing it, if any.
+    __condition : threading.Condition
+        Guards `__waiters` and wakes up the background thread.
+    __flushing : bool
+        True while a batch is being written, from the moment its commits are
+        taken from `__waiters`.
+    batches : int
+        Number of batches written so far.
+    commits : int
+        Number of commits written so far. `commits / batches` is the average
+        batch size.
+    """
+
+    def __init__(self, flush, window, sync=None, sync_interval=1.0):
+        """Starts the background thread.
+
+        Parameters
+        ----------
+        flush : callable
+            Writes all the pending changes.
+        window : float
+            Seconds to wait for more commits before writing a batch.
+        sync : callable, optional
+            Makes the written changes durable. Called every `sync_interval`
+            seconds.
+        sync_interval : float, optional
+            Seconds between two calls to `sync`.
+        """
+        self.__flush = flush
+        self.__sync = sync
+        self.__window = window
+        self.__sync_interval = sync_interval
+        self.batches = 0
+        self.commits = 0
+        self.__start()
+        if hasattr(os, 'register_at_fork'):
+            os.register_at_fork(after_in_child=self.__start)
+
+    def commit(self):
+        """Blocks until the changes made so far by the calling thread are
+        written.
+
+        Raises
+        ------
+        Exception
+            Whatever `flush` raised while writing the batch.
+        """
+        waiter = [threading.Event(), None]
+        with self.__condition:
+            self.__waiters.append(waiter)
+            self.__condition.notify()
+        waiter[0].wait()
+        if waiter[1] is not None:
+            raise waiter[1]
+
+    def busy(self):
+        """Checks whether commits are waiting or a batch is being written.
+
+        Returns
+        -------
+        bool
+            False if every commit requested so far is written.
+        """
+        with self.__condition:
+            return bool(self.__waiters) or self.__flushing
+
+    def __start(self):
+        """Starts the background thread. Also called in the child process
+        after a fork, which only copies the thread that forked.
+        """
+        self.__waiters = []
+        self.__flushing = False
+        self.__condition = threading.Condition()
+        threading.Thread(target=self.__run, daemon=True).start()
+
+    def __run(self):
+        """Writes batches of commits until the process exits"""
+        next_sync = time.monotonic() + self.__sync_interval
+        while True:
+            with self.__condition:
+                while not self.__waiters:
+                    if self.__sync is None:
+                        self.__condition.wait()
+                        continue
+                    timeout = next_sync - time.monotonic()
+                    if timeout <= 0 or not self.__condition.wait(timeout):
+                        break
+            if self.__sync is not None and time.monotonic() >= next_sync:
+                self.__call(self.__sync)
+                next_sync = time.monotonic() + self.__sync_interval
+            if not self.__waiters:
+                continue
+
+            time.sleep(self.__window)
+            with self.__condition:
+                waiters, self.__waiters = self.__waiters, []
+                self.__flushing = True
+            error = self.__call(self.__flush)
+            with self.__condition:
+                self.__flushing = False
+            self.batches += 1
+            self.commits += len(waiters)
+            for waiter in waiters:
+                waiter[1] = error
+                waiter[0].set()
+
+    @staticmethod
+    def __call(function):
+        """Calls a function, returning the exception it raised if any"""
+        try:
+            function()
+        except Exception as error:
+            return error
+        return None
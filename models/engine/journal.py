@@ -0,0 +1,180 @@
+#!/usr/bin/python3
+
+"""Append-only journal used by the file storage engine.
+
+Every change made to the file storage (a new object, an updated object or a
+deleted object) is appended to the journal as a single JSON line instead of
+rewriting the whole snapshot file. On start up, the snapshot is loaded and the
+journal is replayed on top of it.
+"""
+
+import os
+from models.engine import fast_json
+
+
+class Journal():
+    """Append-only log of changes made to the file storage.
+
+    Each line in the journal is a JSON object with the following keys:
+        `op` - either `put` (object created or updated) or `del` (object
+            deleted).
+        `key` - the storage key of the object ie <class_name>.<id>
+        `obj` - the dict representation of the object. Only present for `put`
+            records.
+
+    A batch of records appended together is written as a single line with
+    the `op` `batch` and the records in `records`, so that a crash in the
+    middle of the append leaves a truncated line that is ignored: either
+    every record of the batch is replayed or none is.
+
+    Attributes
+    ----------
+    __path : str
+        Path to the active journal file.
+    __rotated_path : str
+        Path to the journal file that is being compacted into the snapshot.
+    """
+
+    def __init__(self, path):
+        """Creates a journal stored at the given path.
+
+        Parameters
+        ----------
+        path : str
+            Path to the journal file.
+        """
+        self.__path = path
+        self.__rotated_path = path + '.old'
+
+    @property
+    def path(self):
+        """Path to the active journal file"""
+        return self.__path
+
+    def size(self):
+        """Returns the size in bytes of the active journal file"""
+        try:
+            return os.path.getsize(self.__path)
+        except OSError:
+            return 0
+
+    def append(self, records, sync=False):
+        """Appends a batch of records to the journal with a single write.
+
+        The batch is replayed as a whole or not at all.
+
+        Parameters
+        ----------
+        records : list
+            The records (dicts) to be appended.
+        sync : bool, optional
+            If True, the records are flushed to disk with `os.fsync` before
+            returning.
+
+        Returns
+        -------
+        int
+            The size of the journal after the records have been appended.
+        """
+        if not records:
+            return self.size()
+        if len(records) == 1:
+            lines = fast_json.dumps_bytes(records[0]) + b'\n'
+        else:
+            lines = fast_json.dumps_bytes({'op': 'batch',
+                                           'records': records}) + b'\n'
+        with open(self.__path, 'ab') as journal_file:
+            journal_file.write(lines)
+            journal_file.flush()
+            if sync:
+                os.fsync(journal_file.fileno())
+            return journal_file.tell()
+
+    def sync(self):
+        """Flushes the records appended so far to disk with `os.fsync`"""
+        try:
+            journal_fd = os.open(self.__path, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            os.fsync(journal_fd)
+        finally:
+            os.close(journal_fd)
+
+    def replay(self, offset=None):
+        """Reads the records in the journal starting at the given byte offset.
+
+        When no offset is given, records left over from an interrupted
+        compaction are read first, followed by the whole active journal. A
+        truncated last line (eg. from a crash in the middle of an append) is
+        ignored.
+
+        Parameters
+        ----------
+        offset : int, optional
+            Byte offset in the active journal to start reading from.
+
+        Returns
+        -------
+        tuple
+            A list of the records read and the byte offset at which reading
+            stopped.
+        """
+        records = []
+        if offset is None:
+            offset = 0
+            if os.path.exists(self.__rotated_path):
+                records.extend(self.__read(self.__rotated_path, 0)[0])
+        if not os.path.exists(self.__path):
+            return records, 0
+        new_records, end = self.__read(self.__path, offset)
+        records.extend(new_records)
+        return records, end
+
+    def rotate(self):
+        """Moves the active journal aside so that it can be compacted.
+
+        New records are appended to a fresh journal file while the rotated one
+        is being compacted. If a rotated journal is left over from an
+        interrupted compaction, the active journal is appended to it instead.
+        """
+        if not os.path.exists(self.__path):
+            return
+        if os.path.exists(self.__rotated_path):
+            with open(self.__path, 'r', encoding='utf-8') as src, \
+                 open(self.__rotated_path, 'a', encoding='utf-8') as dest:
+                dest.write(src.read())
+            os.remove(self.__path)
+        else:
+            os.replace(self.__path, self.__rotated_path)
+
+    def discard_rotated(self):
+        """Removes the rotated journal once it is part of the snapshot"""
+        if os.path.exists(self.__rotated_path):
+            os.remove(self.__rotated_path)
+
+    def clear(self):
+        """Removes both the active and the rotated journal files"""
+        self.discard_rotated()
+        if os.path.exists(self.__path):
+            os.remove(self.__path)
+
+    @staticmethod
+    def __read(path, offset):
+        """Reads the JSON lines in a file starting at the given byte offset,
+        with the records of each batch in place of the batch.
+        """
+        records = []
+        with open(path, 'rb') as journal_file:
+            journal_file.seek(offset)
+            end = offset
+            for line in journal_file:
+                if not line.endswith(b'\n'):
+                    break
+                record = fast_json.loads(line)
+                if record['op'] == 'batch':
+                    records.extend(record['records'])
+                else:
+                    records.append(record)
+                end += len(line)
+        return records, end
@@ -0,0 +1,94 @@
+#!/usr/bin/python3
+
+"""Builds model objects from the dict representations read from storage."""
+
+from datetime import datetime
+
+
+class ObjectLoader():
+    """Registry-based loader for the file storage engine.
+
+    Classes are looked up by name in a registry instead of calling `eval` on
+    the `__class__` of every record, and objects are created without calling
+    their constructor: the record becomes the object's `__dict__` and the
+    datetime attributes listed in the class' `__datetime_fields__` are parsed
+    with `datetime.fromisoformat`.
+
+    Attributes
+    ----------
+    __classes : dict
+        The classes whose objects can be loaded, by name.
+    """
+
+    def __init__(self, classes):
+        """Creates a loader for the given classes.
+
+        Parameters
+        ----------
+        classes : dict
+            The classes whose objects can be loaded, by name.
+        """
+        self.__classes = dict(classes)
+
+    def build(self, record):
+        """Builds an object from its dict representation.
+
+        The record is used as the `__dict__` of the new object, so it must not
+        be used by the caller afterwards.
+
+        Parameters
+        ----------
+        record : dict
+            The dict representation of the object, as written by `to_dict()`.
+
+        Raises
+        ------
+        KeyError
+            If the class of the object is not known.
+        """
+        cls = self.__classes[record.pop('__class__')]
+        for name in cls.__datetime_fields__:
+            value = record.get(name)
+            if value and type(value) is str:
+                record[name] = datetime.fromisoformat(value)
+        obj = object.__new__(cls)
+        obj.__dict__ = record
+        return obj
+
+    def build_all(self, records):
+        """Builds objects from many dict representations at once.
+
+        Parameters
+        ----------
+        records : dict or iterable
+            The dict representations of the objects, by storage key, or an
+            iterable of (storage key, dict representation) pairs such as the
+            one returned by `snapshot.iter_records()`. Each object is built
+            as soon as its pair is produced.
+
+        Returns
+        -------
+        dict
+            Maps each class name to the objects built for that class, by
+            storage key.
+        """
+        if isinstance(records, dict):
+            records = records.items()
+        classes = self.__classes
+        fromisoformat = datetime.fromisoformat
+        new = object.__new__
+        objs_by_class = {}
+        for key, record in records:
+            cls_name = record.pop('__class__')
+            cls = classes[cls_name]
+            for name in cls.__datetime_fields__:
+                value = record.get(name)
+                if value and type(value) is str:
+                    record[name] = fromisoformat(value)
+            obj = new(cls)
+            obj.__dict__ = record
+            objs = objs_by_class.get(cls_name)
+            if objs is None:
+                objs = objs_by_class[cls_name] = {}
+            objs[key] = obj
+        return objs_by_class
@@ -0,0 +1,71 @@
+#!/usr/bin/python3
+
+"""Helpers for keyset pagination in the storage engines.
+
+Objects are paginated in the order of their `(created_at, id)` pair. A cursor
+is an opaque string holding the `(created_at, id)` pair of the last object of
+a page; the next page starts right after that object.
+"""
+
+import json
+import base64
+import binascii
+from datetime import datetime
+
+
+def order_key(obj):
+    """Returns the `(created_at, id)` pair objects are paginated by.
+
+    Parameters
+    ----------
+    obj : object
+        The object, or its dict representation, whose key is to be returned.
+    """
+    if type(obj) is dict:
+        created_at = obj['created_at']
+        if type(created_at) is str:
+            created_at = datetime.fromisoformat(created_at)
+        return (created_at, obj['id'])
+    return (obj.created_at, obj.id)
+
+
+def encode_cursor(obj):
+    """Builds the cursor pointing right after the given object.
+
+    Parameters
+    ----------
+    obj : object
+        The last object of a page.
+
+    Returns
+    -------
+    str
+        The opaque cursor.
+    """
+    key = [obj.created_at.isoformat(), obj.id]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Reads the `(created_at, id)` pair held in a cursor.
+
+    Parameters
+    ----------
+    cursor : str
+        A cursor built by `encode_cursor()`.
+
+    Returns
+    -------
+    tuple
+        The `(created_at, id)` pair.
+
+    Raises
+    ------
+    ValueError
+        If the cursor is not valid.
+    """
+    try:
+        created_at, obj_id = json.loads(base64.urlsafe_b64decode(cursor))
+        return (datetime.fromisoformat(created_at), str(obj_id))
+    except (binascii.Error, TypeError, ValueError) as error:
+        raise ValueError(f'Invalid cursor: {cursor}') from error
@@ -0,0 +1,111 @@
+#!/usr/bin/python3
+
+"""Coordination of the processes sharing the files of the file storage
+engine, eg the workers of a pre-forking server.
+
+A lock file is locked with `fcntl.flock` while a process writes to storage,
+and holds a generation counter that every write increments. A process that
+finds the counter unchanged since it last looked knows that no other process
+wrote to storage, without reading any of the storage files.
+"""
+
+import os
+import struct
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+COUNTER = struct.Struct('<Q')
+
+
+class ProcessLock():
+    """Advisory lock shared by processes, with a generation counter.
+
+    Used as a context manager. The lock is not reentrant and only excludes
+    other processes: threads of the same process must be serialized by the
+    caller. On platforms without `fcntl`, the lock does nothing but the
+    counter is still maintained.
+
+    The lock file is opened again after a fork, since a file descriptor
+    inherited from the parent process would share its lock.
+
+    Example:
+        lock = ProcessLock('models.json.lock')
+        with lock:
+            ...
+            lock.increment()
+
+    Attributes
+    ----------
+    __path : str
+        Path to the lock file.
+    __fd : int
+        File descriptor of the lock file, or `None` until it is opened.
+    __pid : int
+        Identifier of the process that opened `__fd`.
+    """
+
+    def __init__(self, path):
+        """Creates a lock over the given file, which is created if needed.
+
+        Parameters
+        ----------
+        path : str
+            Path to the lock file.
+        """
+        self.__path = path
+        self.__fd = None
+        self.__pid = None
+
+    def __enter__(self):
+        """Blocks until no other process holds the lock, then takes it"""
+        if fcntl is not None:
+            fcntl.flock(self.__file(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        """Releases the lock"""
+        if fcntl is not None:
+            fcntl.flock(self.__file(), fcntl.LOCK_UN)
+
+    def generation(self):
+        """Returns the value of the generation counter.
+
+        Can be called without holding the lock.
+
+        Returns
+        -------
+        int
+            The number of writes made to storage by all the processes, or 0
+            if none was made yet.
+        """
+        data = os.pread(self.__file(), COUNTER.size, 0)
+        if len(data) < COUNTER.size:
+            return 0
+        return COUNTER.unpack(data)[0]
+
+    def increment(self):
+        """Increments the generation counter. Must be called with the lock
+        held.
+
+        Returns
+        -------
+        int
+            The new value of the counter.
+        """
+        generation = self.generation() + 1
+        os.pwrite(self.__file(), COUNTER.pack(generation), 0)
+        return generation
+
+    def __file(self):
+        """Returns the file descriptor of the lock file, opening it in the
+        current process if needed.
+        """
+        if self.__fd is None or self.__pid != os.getpid():
+            if self.__fd is not None:
+                os.close(self.__fd)
+            self.__fd = os.open(self.__path, os.O_RDWR | os.O_CREAT, 0o644)
+            self.__pid = os.getpid()
+        return self.__fd
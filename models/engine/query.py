@@ -0,0 +1,72 @@
+#!/usr/bin/python3
+
+"""Helpers for the filtering criteria accepted by the storage engines.
+
+Criteria are passed to `storage.filter()`, `storage.first()` and
+`storage.exists()` as keyword arguments. A keyword is either an attribute name,
+which matches objects whose attribute is equal to the value, or an attribute
+name followed by `__iexact`, which matches strings regardless of case.
+
+Example:
+    storage.filter(Route, partner_id=partner.id)
+    storage.filter(Route, start_destination__iexact='nairobi')
+"""
+
+OPERATORS = ('exact', 'iexact')
+
+
+def parse_criteria(criteria):
+    """Splits filtering criteria into (attribute, operator, value) triples.
+
+    Parameters
+    ----------
+    criteria : dict
+        The keyword arguments passed to the storage engine.
+
+    Returns
+    -------
+    list
+        The (attribute, operator, value) triples.
+
+    Raises
+    ------
+    ValueError
+        If an unknown operator is used.
+    """
+    conditions = []
+    for key, value in criteria.items():
+        attribute, _, operator = key.partition('__')
+        operator = operator or 'exact'
+        if operator not in OPERATORS:
+            raise ValueError(f'Unknown filter operator: {operator}')
+        if operator == 'iexact' and isinstance(value, str):
+            value = value.lower()
+        conditions.append((attribute, operator, value))
+    return conditions
+
+
+def matches(obj, conditions):
+    """Checks whether an object satisfies all the given conditions.
+
+    Parameters
+    ----------
+    obj : object
+        The object, or its dict representation, to be checked.
+    conditions : list
+        (attribute, operator, value) triples returned by `parse_criteria()`.
+
+    Returns
+    -------
+    bool
+        True if the object satisfies every condition.
+    """
+    for attribute, operator, value in conditions:
+        if type(obj) is dict:
+            obj_value = obj.get(attribute)
+        else:
+            obj_value = getattr(obj, attribute, None)
+        if operator == 'iexact' and isinstance(obj_value, str):
+            obj_value = obj_value.lower()
+        if obj_value != value:
+            return False
+    return True
@@ -0,0 +1,180 @@
+#!/usr/bin/python3
+
+"""Seat reservation helpers shared by the storage engines: the per-route
+locks of the file storage engine and the contention metrics reported by
+`storage.reservation_stats()`.
+"""
+
+import threading
+import weakref
+from collections import Counter
+from contextlib import contextmanager
+
+# Number of routes listed in `hot_routes`
+HOT_ROUTES = 5
+
+
+class RouteLocks():
+    """One lock per route, so that reservations on different routes do not
+    wait for each other.
+
+    Attributes
+    ----------
+    __locks : weakref.WeakValueDictionary
+        Maps a route ID to its lock. Locks are created on first use and
+        dropped once no thread holds or waits for them, so that the number
+        of locks kept does not grow with the number of routes ever booked.
+    __guard : threading.Lock
+        Guards `__locks`.
+    """
+
+    def __init__(self):
+        """Creates an empty set of locks"""
+        self.__locks = weakref.WeakValueDictionary()
+        self.__guard = threading.Lock()
+
+    @contextmanager
+    def hold(self, route_id):
+        """Holds the lock of a route for the duration of a `with` block.
+
+        Yields True if the lock was held by another thread, which was then
+        waited for.
+
+        Parameters
+        ----------
+        route_id : str
+            The ID of the route.
+        """
+        with self.__guard:
+            lock = self.__locks.get(route_id)
+            if lock is None:
+                lock = self.__locks[route_id] = threading.Lock()
+        contended = not lock.acquire(blocking=False)
+        if contended:
+            lock.acquire()
+        try:
+            yield contended
+        finally:
+            lock.release()
+
+
+class ReservationStats():
+    """Counters of the seat reservations made by a storage engine.
+
+    Attributes
+    ----------
+    __lock : threading.Lock
+        Guards the counters.
+    __reserved : int
+        Number of reservations made.
+    __seats : int
+        Number of seats reserved.
+    __rejected : int
+        Number of reservations rejected for lack of seats.
+    __released : int
+        Number of cancelled reservations.
+    __seats_released : int
+        Number of seats given back by the cancelled reservations.
+    __contended : int
+        Number of reservations that found another reservation on the same
+        route in progress.
+    __retries : int
+        Number of times a reservation was retried after a lock conflict
+        reported by the database.
+    __time : float
+        Total number of seconds spent taking seats, including the time spent
+        waiting for the other reservations on the same route.
+    __max_time : float
+        Longest time spent taking seats, in seconds.
+    __contended_routes : Counter
+        Number of contended reservations of each route.
+    """
+
+    def __init__(self):
+        """Creates the counters"""
+        self.__lock = threading.Lock()
+        self.__reserved = 0
+        self.__seats = 0
+        self.__rejected = 0
+        self.__released = 0
+        self.__seats_released = 0
+        self.__contended = 0
+        self.__retries = 0
+        self.__time = 0.0
+        self.__max_time = 0.0
+        self.__contended_routes = Counter()
+
+    def record(self, route_id, seats, reserved, seconds, contended,
+               retries=0):
+        """Records a reservation attempt.
+
+        Parameters
+        ----------
+        route_id : str
+            The ID of the route.
+        seats : int
+            The number of seats requested.
+        reserved : bool
+            True if the seats were reserved, False if there were not enough.
+        seconds : float
+            Time spent taking the seats, including waiting for the other
+            reservations on the route.
+        contended : bool
+            True if another reservation on the route was in progress.
+        retries : int, optional
+            Number of times the reservation was retried.
+        """
+        with self.__lock:
+            if reserved:
+                self.__reserved += 1
+                self.__seats += seats
+            else:
+                self.__rejected += 1
+            self.__retries += retries
+            if contended:
+                self.__contended += 1
+                self.__contended_routes[route_id] += 1
+            self.__time += seconds
+            self.__max_time = max(self.__max_time, seconds)
+
+    def release(self, seats):
+        """Records a cancelled reservation.
+
+        Parameters
+        ----------
+        seats : int
+            The number of seats given back.
+        """
+        with self.__lock:
+            self.__released += 1
+            self.__seats_released += seats
+
+    def stats(self):
+        """Returns the counters.
+
+        Returns
+        -------
+        dict
+            `reserved`, `seats_reserved`, `rejected`, `released`,
+            `seats_released`, `contended`, `retries`, `avg_reserve_ms` and
+            `max_reserve_ms` (the time taken to take the seats) and
+            `hot_routes`, the routes with the most contended reservations.
+        """
+        with self.__lock:
+            attempts = self.__reserved + self.__rejected
+            return {
+                'reserved': self.__reserved,
+                'seats_reserved': self.__seats,
+                'rejected': self.__rejected,
+                'released': self.__released,
+                'seats_released': self.__seats_released,
+                'contended': self.__contended,
+                'retries': self.__retries,
+                'avg_reserve_ms': (self.__time / attempts * 1000
+                                   if attempts else 0.0),
+                'max_reserve_ms': self.__max_time * 1000,
+                'hot_routes': [
+                    {'route_id': route_id, 'contended': contended}
+                    for route_id, contended in
+                    self.__contended_routes.most_common(HOT_ROUTES)],
+            }
@@ -0,0 +1,86 @@
+#!/usr/bin/python3
+
+"""Reader/writer lock used by the file storage engine."""
+
+import threading
+from contextlib import contextmanager
+
+
+class ReadWriteLock():
+    """Lock that lets many readers or a single writer in at a time.
+
+    Writers are preferred: once a writer is waiting, new readers wait until
+    it is done, so a steady flow of readers cannot starve writers. The write
+    lock is reentrant, and the thread holding it may also take the read lock.
+    A thread holding the read lock must not take the read lock again nor the
+    write lock.
+
+    Example:
+        lock = ReadWriteLock()
+        with lock.read():
+            ...
+        with lock.write():
+            ...
+
+    Attributes
+    ----------
+    __condition : threading.Condition
+        Guards the state of the lock.
+    __readers : int
+        Number of threads holding the read lock.
+    __writer : int
+        Identifier of the thread holding the write lock, or `None`.
+    __writer_depth : int
+        Number of times the writer took the write lock without releasing it.
+    __waiting_writers : int
+        Number of threads waiting for the write lock.
+    """
+
+    def __init__(self):
+        """Creates an unlocked lock"""
+        self.__condition = threading.Condition()
+        self.__readers = 0
+        self.__writer = None
+        self.__writer_depth = 0
+        self.__waiting_writers = 0
+
+    @contextmanager
+    def read(self):
+        """Holds the read lock for the duration of a `with` block"""
+        if self.__writer == threading.get_ident():
+            yield
+            return
+        with self.__condition:
+            while self.__writer is not None or self.__waiting_writers:
+                self.__condition.wait()
+            self.__readers += 1
+        try:
+            yield
+        finally:
+            with self.__condition:
+                self.__readers -= 1
+                if not self.__readers:
+                    self.__condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        """Holds the write lock for the duration of a `with` block"""
+        thread = threading.get_ident()
+        with self.__condition:
+            if self.__writer != thread:
+                self.__waiting_writers += 1
+                try:
+                    while self.__writer is not None or self.__readers:
+                        self.__condition.wait()
+                finally:
+                    self.__waiting_writers -= 1
+                self.__writer = thread
+            self.__writer_depth += 1
+        try:
+            yield
+        finally:
+            with self.__condition:
+                self.__writer_depth -= 1
+                if not self.__writer_depth:
+                    self.__writer = None
+                    self.__condition.notify_all()
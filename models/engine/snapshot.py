@@ -0,0 +1,741 @@
+#!/usr/bin/python3
+
+"""Reads and writes the snapshot file of the file storage engine.
+
+Two formats are supported:
+
+    json - the dict representations of all the objects in one JSON object,
+        keyed by storage key. This is the default format. Each object is
+        written on a line of its own, so that the file can be read in batches
+        of lines by `iter_records()`.
+    binary - a compact binary format. The file starts with `MAGIC` and is
+        followed by length-prefixed sections. Each section holds objects of a
+        single class having the same attributes, column by column: the
+        attribute names are stored once per section, strings are stored
+        without quotes or escapes, and numbers as fixed-size integers and
+        floats (see `_dump_column()`). Datetime values are stored in ISO
+        format. The encoding only uses `struct` layouts and JSON, so it does
+        not depend on the Python version. Files are about 40% smaller than
+        in the json format, but not faster to load when orjson is installed;
+        compression shrinks both formats much more.
+
+The snapshot file keeps its name (`models.json`) whatever its format and
+compression, so the name does not imply that the content is JSON.
+The format of a file is detected from its first bytes when it is read, so a
+storage can be switched from one format to the other without converting its
+file first: the new format is used from the next save onwards.
+
+Files in either format can be compressed with gzip or with zstd (`COMPRESSIONS`).
+The compression is detected in the same way when a file is read. zstd needs
+the `zstandard` package, which is optional.
+
+`iter_records()` reads a file one object at a time, so that the content of
+the file and all the dict representations are never held in memory at once.
+"""
+
+import gc
+import io
+import os
+import gzip
+import json
+import struct
+import threading
+from itertools import accumulate, islice
+from contextlib import contextmanager
+from datetime import date, datetime
+from models.engine import fast_json
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+FORMATS = ('json', 'binary')
+COMPRESSIONS = ('none', 'gzip', 'zstd')
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+MAGIC = b'MCHT\x00\x01'
+SECTION_SIZE = 10000
+SECTION_HEADER = struct.Struct('<I')
+COUNTS = struct.Struct('<II')
+UINT32 = struct.Struct('<I')
+INT64_MIN = -2 ** 63
+INT64_MAX = 2 ** 63 - 1
+BATCH_LINES = 1000
+CHUNK_SIZE = 1024 * 1024
+
+
+def detect_format(data):
+    """Returns the format of the content of a snapshot file.
+
+    Parameters
+    ----------
+    data : bytes
+        The uncompressed content of the file, or at least its first bytes.
+
+    Returns
+    -------
+    str
+        One of `FORMATS`.
+    """
+    if data.startswith(MAGIC):
+        return 'binary'
+    return 'json'
+
+
+def detect_compression(data):
+    """Returns the compression of the content of a snapshot file.
+
+    Parameters
+    ----------
+    data : bytes
+        The content of the file, or at least its first bytes.
+
+    Returns
+    -------
+    str
+        One of `COMPRESSIONS`.
+    """
+    if data.startswith(GZIP_MAGIC):
+        return 'gzip'
+    if data.startswith(ZSTD_MAGIC):
+        return 'zstd'
+    return 'none'
+
+
+def check_compression(compression):
+    """Checks that snapshots can be written with the given compression.
+
+    Parameters
+    ----------
+    compression : str
+        One of `COMPRESSIONS`.
+
+    Raises
+    ------
+    ValueError
+        If the compression is not known, or is `zstd` and the `zstandard`
+        package is not installed.
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError(f'Unknown snapshot compression: {compression}')
+    if compression == 'zstd' and zstandard is None:
+        raise ValueError('zstd compression needs the zstandard package '
+                         '(pip install zstandard)')
+
+
+def compress(data, compression):
+    """Compresses the content of a snapshot file.
+
+    Parameters
+    ----------
+    data : bytes
+        The content built by `dumps()` or `join_records()`.
+    compression : str
+        One of `COMPRESSIONS`.
+
+    Returns
+    -------
+    bytes
+        The compressed content, or `data` itself when `compression` is
+        `none`.
+
+    Raises
+    ------
+    ValueError
+        See `check_compression()`.
+    """
+    check_compression(compression)
+    if compression == 'gzip':
+        return gzip.compress(data, GZIP_LEVEL, mtime=0)
+    if compression == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return data
+
+
+def decompress(data):
+    """Decompresses the content of a snapshot file, whatever its
+    compression.
+
+    Parameters
+    ----------
+    data : bytes
+        The content of the file.
+
+    Returns
+    -------
+    bytes
+        The uncompressed content.
+
+    Raises
+    ------
+    ValueError
+        If the content is compressed with zstd and the `zstandard` package is
+        not installed.
+    """
+    compression = detect_compression(data)
+    if compression == 'gzip':
+        return gzip.decompress(data)
+    if compression == 'zstd':
+        check_compression(compression)
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return data
+
+
+def dumps(records, file_format='json'):
+    """Serializes the dict representations of objects.
+
+    Parameters
+    ----------
+    records : dict
+        The dict representations of the objects, by storage key.
+    file_format : str, optional
+        One of `FORMATS`.
+
+    Returns
+    -------
+    bytes
+        The content of the snapshot file.
+
+    Raises
+    ------
+    ValueError
+        If the format is not known.
+    """
+    if file_format == 'json':
+        return join_records([dumps_record(key, record)
+                             for key, record in records.items()])
+    if file_format != 'binary':
+        raise ValueError(f'Unknown snapshot format: {file_format}')
+
+    groups = {}
+    for record in records.values():
+        group_key = (record['__class__'], tuple(record))
+        group = groups.get(group_key)
+        if group is None:
+            group = groups[group_key] = []
+        group.append(record)
+
+    chunks = [MAGIC]
+    for (cls_name, fields), group in groups.items():
+        for start in range(0, len(group), SECTION_SIZE):
+            section = _dump_section(cls_name, fields,
+                                    group[start:start + SECTION_SIZE])
+            chunks.append(SECTION_HEADER.pack(len(section)))
+            chunks.append(section)
+    return b''.join(chunks)
+
+
+def dumps_record(key, record):
+    """Serializes one object, with its storage key, for a snapshot in the
+    json format.
+
+    Used with `join_records()` by callers that keep the serialized objects
+    to avoid serializing unchanged objects again.
+
+    Parameters
+    ----------
+    key : str
+        The storage key of the object.
+    record : dict
+        The dict representation of the object.
+
+    Returns
+    -------
+    bytes
+        The serialized object.
+    """
+    return fast_json.dumps_bytes(key) + b':' + fast_json.dumps_bytes(record)
+
+
+def join_records(encoded_records):
+    """Builds the content of a snapshot in the json format from objects
+    serialized by `dumps_record()`.
+
+    Parameters
+    ----------
+    encoded_records : list
+        The serialized objects.
+
+    Returns
+    -------
+    bytes
+        The content of the snapshot file.
+    """
+    return b'{\n' + b',\n'.join(encoded_records) + b'\n}\n'
+
+
+def loads(data):
+    """Deserializes the content of a snapshot file in any format.
+
+    Parameters
+    ----------
+    data : bytes
+        The content of the snapshot file, compressed or not.
+
+    Returns
+    -------
+    dict
+        The dict representations of the objects, by storage key.
+
+    Raises
+    ------
+    ValueError
+        If the content is not a valid snapshot.
+    """
+    data = decompress(data)
+    if detect_format(data) == 'json':
+        return fast_json.loads(data)
+
+    with _gc_paused():
+        return _read_sections(data)
+
+
+def iter_records(path):
+    """Reads a snapshot file in any format one object at a time.
+
+    Only a batch of lines (json format) or a section (binary format) of the
+    file is held in memory at a time. Files in the json format that were not
+    written by `join_records()` are parsed incrementally, in chunks of
+    `CHUNK_SIZE` characters. Compressed files are decompressed as they are
+    read.
+
+    Parameters
+    ----------
+    path : str
+        Path to the snapshot file.
+
+    Yields
+    ------
+    tuple
+        The storage key and the dict representation of each object.
+
+    Raises
+    ------
+    ValueError
+        If the content is not a valid snapshot.
+    """
+    with open(path, 'rb') as raw_file, _reader(raw_file) as snapshot_file:
+        head = snapshot_file.peek(CHUNK_SIZE)
+        if detect_format(head) == 'binary':
+            snapshot_file.read(len(MAGIC))
+            yield from _iter_sections(snapshot_file)
+            return
+        if head.startswith(b'{\n') and b'\n' in head[2:]:
+            first_line = head[2:head.index(b'\n', 2)].rstrip()
+            if first_line in (b'', b'}') or \
+               (first_line.startswith(b'"') and
+                first_line.endswith((b'}', b'},'))):
+                snapshot_file.read(2)
+                yield from _iter_lines(snapshot_file)
+                return
+        reader = io.TextIOWrapper(snapshot_file, encoding='utf-8')
+        yield from _JsonStream(reader).entries()
+
+
+@contextmanager
+def _reader(raw_file):
+    """Returns a buffered reader of the uncompressed content of a snapshot
+    file, whatever its compression.
+    """
+    compression = detect_compression(raw_file.read(len(ZSTD_MAGIC)))
+    raw_file.seek(0)
+    if compression == 'gzip':
+        stream = gzip.GzipFile(fileobj=raw_file, mode='rb')
+    elif compression == 'zstd':
+        check_compression(compression)
+        stream = zstandard.ZstdDecompressor().stream_reader(raw_file)
+    else:
+        stream = raw_file
+    reader = io.BufferedReader(stream, CHUNK_SIZE)
+    try:
+        yield reader
+    finally:
+        if stream is not raw_file:
+            stream.close()
+
+
+@contextmanager
+def _gc_paused():
+    """Pauses the garbage collector while sections are decoded: the many
+    container objects created would otherwise trigger collections that find
+    nothing to collect.
+    """
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+
+def _iter_lines(snapshot_file):
+    """Parses a snapshot written by `join_records()`, whose objects are on
+    lines of their own, `BATCH_LINES` lines at a time. The file must be
+    positioned right after the opening line.
+    """
+    while True:
+        lines = list(islice(snapshot_file, BATCH_LINES))
+        if not lines:
+            raise ValueError('Truncated snapshot')
+        closed = lines[-1].strip() == b'}'
+        if closed:
+            lines.pop()
+        batch = b''.join(lines).rstrip().rstrip(b',')
+        if batch:
+            yield from fast_json.loads(b'{' + batch + b'}').items()
+        if closed:
+            return
+
+
+def _iter_sections(snapshot_file):
+    """Decodes the sections of a snapshot in the binary format one at a
+    time. The file must be positioned right after `MAGIC`.
+    """
+    header_size = SECTION_HEADER.size
+    while True:
+        header = snapshot_file.read(header_size)
+        if not header:
+            return
+        if len(header) < header_size:
+            raise ValueError('Truncated snapshot section header')
+        size, = SECTION_HEADER.unpack(header)
+        section = snapshot_file.read(size)
+        if len(section) < size:
+            raise ValueError('Truncated snapshot section')
+        with _gc_paused():
+            records = _decode_section(section)
+        yield from records.items()
+
+
+def _dump_section(cls_name, fields, records):
+    """Encodes records of one class having the same attributes as one
+    section.
+
+    The section holds the number of records, the number of attributes, a
+    string column with the class name and the attribute names, then one
+    column per attribute (see `_dump_column()`).
+    """
+    columns = [_dump_column([cls_name, *fields])]
+    for field in fields:
+        columns.append(_dump_column([record[field] for record in records]))
+    return COUNTS.pack(len(records), len(fields)) + b''.join(columns)
+
+
+def _dump_column(values):
+    """Encodes the values of an attribute as a column.
+
+    Datetime values are converted to ISO format. A column starts with a
+    type byte:
+
+        s - strings: the length in characters of every string (uint32), the
+            size of the text (uint32) and the text of the strings, joined,
+            in UTF-8.
+        q - integers: every value as an int64.
+        d - floats: every value as a float64.
+        j - any other values, eg a mix of integers and nulls: the size
+            (uint32) and the values as a JSON array.
+
+    All numbers are little-endian.
+    """
+    kinds = set(map(type, values))
+    if any(issubclass(kind, date) for kind in kinds):
+        values = [value.isoformat() if isinstance(value, date) else value
+                  for value in values]
+        kinds = set(map(type, values))
+    count = len(values)
+    if kinds == {str}:
+        text = ''.join(values).encode('utf-8')
+        return b''.join((b's', struct.pack(f'<{count}I', *map(len, values)),
+                         UINT32.pack(len(text)), text))
+    if kinds == {int} and INT64_MIN <= min(values) and \
+       max(values) <= INT64_MAX:
+        return b'q' + struct.pack(f'<{count}q', *values)
+    if kinds == {float}:
+        return b'd' + struct.pack(f'<{count}d', *values)
+    text = fast_json.dumps_bytes(values)
+    return b'j' + UINT32.pack(len(text)) + text
+
+
+def _read_sections(data):
+    """Decodes the sections of a snapshot in the binary format"""
+    records = {}
+    view = memoryview(data)
+    position = len(MAGIC)
+    header_size = SECTION_HEADER.size
+    while position < len(data):
+        if position + header_size > len(data):
+            raise ValueError('Truncated snapshot section header')
+        size, = SECTION_HEADER.unpack_from(view, position)
+        position += header_size
+        if position + size > len(data):
+            raise ValueError('Truncated snapshot section')
+        records.update(_decode_section(view[position:position + size]))
+        position += size
+    return records
+
+
+def _decode_section(section):
+    """Decodes one section of a snapshot in the binary format into the dict
+    representations of its objects, by storage key.
+    """
+    try:
+        count, field_count = COUNTS.unpack_from(section, 0)
+        names, position = _read_column(section, COUNTS.size, field_count + 1)
+        columns = []
+        for _ in range(field_count):
+            column, position = _read_column(section, position, count)
+            columns.append(column)
+        if position != len(section):
+            raise ValueError('Invalid snapshot section')
+    except (struct.error, IndexError, UnicodeDecodeError):
+        raise ValueError('Invalid snapshot section') from None
+    prefix = names[0] + '.'
+    fields = names[1:]
+    ids = columns[fields.index('id')]
+    return {prefix + obj_id: dict(zip(fields, row))
+            for obj_id, row in zip(ids, zip(*columns))}
+
+
+def _read_column(section, position, count):
+    """Decodes a column of `count` values written by `_dump_column()` at the
+    given position of a section. Returns the values and the position right
+    after the column.
+    """
+    kind = bytes(section[position:position + 1])
+    position += 1
+    if kind == b's':
+        lengths = struct.unpack_from(f'<{count}I', section, position)
+        position += 4 * count
+        size, = UINT32.unpack_from(section, position)
+        position += UINT32.size
+        text = bytes(section[position:position + size]).decode('utf-8')
+        if len(text) != sum(lengths):
+            raise ValueError('Invalid snapshot column')
+        ends = list(accumulate(lengths))
+        starts = [0] + ends[:-1]
+        return ([text[start:end] for start, end in zip(starts, ends)],
+                position + size)
+    if kind in (b'q', b'd'):
+        column_format = f'<{count}{kind.decode()}'
+        return (list(struct.unpack_from(column_format, section, position)),
+                position + struct.calcsize(column_format))
+    if kind == b'j':
+        size, = UINT32.unpack_from(section, position)
+        position += UINT32.size
+        values = fast_json.loads(bytes(section[position:position + size]))
+        if type(values) is not list or len(values) != count:
+            raise ValueError('Invalid snapshot column')
+        return values, position + size
+    raise ValueError('Invalid snapshot column')
+
+
+class _JsonStream():
+    """Incremental parser for a JSON object whose entries are read one at a
+    time from a text stream, whatever the layout of the text.
+
+    Attributes
+    ----------
+    __reader : io.TextIOBase
+        The stream the text is read from, `CHUNK_SIZE` characters at a time.
+    __text : str
+        The text read from the stream and not parsed yet.
+    __position : int
+        Position in `__text` of the next character to be parsed.
+    """
+
+    def __init__(self, reader):
+        """Creates a parser reading from the given text stream"""
+        self.__reader = reader
+        self.__text = ''
+        self.__position = 0
+        self.__decode = json.JSONDecoder().raw_decode
+
+    def entries(self):
+        """Yields the (key, value) pairs of the JSON object"""
+        self.__expect('{')
+        if self.__peek() == '}':
+            return
+        while True:
+            key = self.__value()
+            if type(key) is not str:
+                raise ValueError('Invalid key in snapshot')
+            self.__expect(':')
+            yield key, self.__value()
+            separator = self.__peek()
+            self.__position += 1
+            if separator == '}':
+                return
+            if separator != ',':
+                raise ValueError('Expected "," or "}" in snapshot')
+
+    def __fill(self):
+        """Reads more text, dropping the text parsed so far. Returns False
+        at the end of the stream.
+        """
+        data = self.__reader.read(CHUNK_SIZE)
+        if not data:
+            return False
+        self.__text = self.__text[self.__position:] + data
+        self.__position = 0
+        return True
+
+    def __peek(self):
+        """Skips whitespace and returns the next character, or an empty
+        string at the end of the stream.
+        """
+        while True:
+            text = self.__text
+            position = self.__position
+            while position < len(text) and text[position] in ' \t\n\r':
+                position += 1
+            self.__position = position
+            if position < len(text):
+                return text[position]
+            if not self.__fill():
+                return ''
+
+    def __expect(self, character):
+        """Skips the given character, which must come next"""
+        if self.__peek() != character:
+            raise ValueError(f'Expected "{character}" in snapshot')
+        self.__position += 1
+
+    def __value(self):
+        """Decodes the next value, reading more text until it is complete.
+
+        A value that ends with the text read so far is decoded again once
+        more text is read, since a number could be cut in two.
+        """
+        self.__peek()
+        while True:
+            try:
+                value, end = self.__decode(self.__text, self.__position)
+                if end < len(self.__text):
+                    self.__position = end
+                    return value
+            except ValueError:
+                pass
+            if not self.__fill():
+                value, self.__position = self.__decode(self.__text,
+                                                       self.__position)
+                return value
+
+
+def read(path):
+    """Reads a snapshot file in any format.
+
+    Parameters
+    ----------
+    path : str
+        Path to the snapshot file.
+
+    Returns
+    -------
+    dict
+        The dict representations of the objects, by storage key.
+    """
+    with open(path, 'rb') as snapshot_file:
+        return loads(snapshot_file.read())
+
+
+def write(path, records, file_format='json', sync=False, compression='none'):
+    """Writes a snapshot file.
+
+    The content is written to a temporary file which then replaces the
+    snapshot file, so a crash never leaves a partially written file behind.
+
+    Parameters
+    ----------
+    path : str
+        Path to the snapshot file.
+    records : dict
+        The dict representations of the objects, by storage key.
+    file_format : str, optional
+        One of `FORMATS`.
+    sync : bool, optional
+        If True, the file is flushed to disk with `os.fsync` before
+        returning.
+    compression : str, optional
+        One of `COMPRESSIONS`.
+    """
+    write_bytes(path, dumps(records, file_format), sync, compression)
+
+
+def write_bytes(path, data, sync=False, compression='none'):
+    """Writes content built by `dumps()` or `join_records()` to a snapshot
+    file. See `write()`.
+
+    The temporary file is named after the process and the thread writing
+    it, so that concurrent writers never write to the same temporary file.
+    It is removed if the write fails.
+
+    Parameters
+    ----------
+    path : str
+        Path to the snapshot file.
+    data : bytes
+        The content of the snapshot file.
+    sync : bool, optional
+        If True, the file is flushed to disk with `os.fsync` before
+        returning.
+    compression : str, optional
+        One of `COMPRESSIONS`.
+    """
+    data = compress(data, compression)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        with open(tmp_path, 'wb') as snapshot_file:
+            snapshot_file.write(data)
+            if sync:
+                snapshot_file.flush()
+                os.fsync(snapshot_file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    if sync:
+        sync_directory(path)
+
+
+def sync_file(path):
+    """Flushes a snapshot file written without `sync` to disk.
+
+    Parameters
+    ----------
+    path : str
+        Path to the snapshot file.
+    """
+    try:
+        snapshot_fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(snapshot_fd)
+    finally:
+        os.close(snapshot_fd)
+    sync_directory(path)
+
+
+def sync_directory(path):
+    """Flushes the directory entry of a file renamed into place to disk.
+
+    Parameters
+    ----------
+    path : str
+        Path to the file.
+    """
+    try:
+        directory_fd = os.open(os.path.dirname(path) or '.', os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(directory_fd)
+    finally:
+        os.close(directory_fd)
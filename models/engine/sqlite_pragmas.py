@@ -0,0 +1,72 @@
+#!/usr/bin/python3
+
+"""Pragmas set on every connection to a SQLite database.
+
+    journal_mode=WAL - readers do not block the writer nor the writer the
+        readers, and a commit only appends to the write-ahead log.
+    synchronous - `NORMAL` by default, which is durable across application
+        crashes in WAL mode and only syncs the log when it is checkpointed.
+        Set with `MICHOTE_SQLITE_SYNCHRONOUS` (`OFF`, `NORMAL`, `FULL` or
+        `EXTRA`).
+    foreign_keys=ON - foreign keys are enforced, as they are by MySQL.
+    temp_store=MEMORY - temporary tables and indexes, eg for sorting, are
+        kept in memory.
+    cache_size - the page cache of each connection, in KiB. Set with
+        `MICHOTE_SQLITE_CACHE_SIZE`. Defaults to 65536 (64 MiB).
+    mmap_size - how much of the database file is read through a memory map,
+        in bytes. Set with `MICHOTE_SQLITE_MMAP_SIZE`. Defaults to 268435456
+        (256 MiB).
+
+How long a connection waits for the writer to release its lock is set by
+`MICHOTE_DB_CONNECT_TIMEOUT` (see `db_pool.py`).
+"""
+
+from os import getenv
+from sqlalchemy import event
+
+SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+
+
+def pragmas():
+    """Returns the pragmas set on the connections, as configured by the
+    environment.
+
+    Returns
+    -------
+    list
+        `(name, value)` tuples, in the order they are set.
+
+    Raises
+    ------
+    ValueError
+        If `MICHOTE_SQLITE_SYNCHRONOUS` is not a valid mode.
+    """
+    synchronous = getenv('MICHOTE_SQLITE_SYNCHRONOUS', 'NORMAL').upper()
+    if synchronous not in SYNCHRONOUS_MODES:
+        raise ValueError(f'Unknown SQLite synchronous mode: {synchronous}')
+    return [('journal_mode', 'WAL'),
+            ('synchronous', synchronous),
+            ('foreign_keys', 'ON'),
+            ('temp_store', 'MEMORY'),
+            ('cache_size', -int(getenv('MICHOTE_SQLITE_CACHE_SIZE', 65536))),
+            ('mmap_size', int(getenv('MICHOTE_SQLITE_MMAP_SIZE',
+                                     268435456)))]
+
+
+def apply_pragmas(engine):
+    """Sets the pragmas on every connection opened by an engine.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+        An engine connected to a SQLite database.
+    """
+    statements = [f'PRAGMA {name}={value}' for name, value in pragmas()]
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        """Sets the pragmas on a new connection"""
+        cursor = dbapi_connection.cursor()
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.close()
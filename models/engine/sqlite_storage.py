@@ -0,0 +1,33 @@
+#!/usr/bin/python3
+
+"""Embedded SQLite storage engine for Michote."""
+
+from os import getenv
+from models.engine.db_storage import DB_Storage
+
+
+class SQLite_Storage(DB_Storage):
+    """Handles the SQLite storage engine.
+
+    Stores the objects in a SQLite database file through the same SQLAlchemy
+    mappings, queries and indexes as the database storage engine, without a
+    database server. Single-node deployments and test runs get indexed
+    queries and transactional writes.
+
+    The connections are set up in WAL mode, with the pragmas described in
+    `sqlite_pragmas.py`, and pooled as configured by the `MICHOTE_DB_*`
+    environment variables (see `db_pool.py`). Read replicas are not used.
+
+    MICHOTE_SQLITE_PATH : str
+        The path to the database file, created if needed. Defaults to
+        `michote.db`.
+
+    MICHOTE_ENV : str
+        The database environment for the session. Can be `dev` or `test`.
+        All the tables are dropped when the storage is created in `test`.
+    """
+
+    def __init__(self):
+        """Initialises a SQLite storage object"""
+        path = getenv('MICHOTE_SQLITE_PATH', 'michote.db')
+        super().__init__(replica_urls=[], url=f'sqlite:///{path}')
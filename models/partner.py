@@ -4,7 +4,7 @@
 
 import models
 
-from models.base_model import BaseModel, Base
+from models.base_model import BaseModel, Base, table_indexes
 from os import getenv
 from models.route import Route
 from sqlalchemy import Column, String
@@ -36,8 +36,11 @@ class Partner(BaseModel, Base):
     
     """
 
-    if models.storage_type == 'db':
+    __indexes__ = (('email',),)
+
+    if models.orm_storage:
         __tablename__ = 'partners'
+        __table_args__ = table_indexes(__tablename__, __indexes__)
         partner_name = Column(String(128), nullable=False)
         phone_number = Column(String(128), nullable=False)
         email = Column(String(128), nullable=False)
@@ -57,13 +60,9 @@ class Partner(BaseModel, Base):
         """Constructor for Partner class"""
         super().__init__(*args, **kwargs)
 
-    if models.storage_type != 'db':
+    if not models.orm_storage:
         @property
         def routes(self):
             """Getter for all the routes under the current partner"""
-            routes_list = []
-            all_routes = models.storage.all(Route)
-            for route in all_routes.values():
-                if route.partner_id == self.id:
-                    routes_list.append(route)
-            return routes_list
+            return list(models.storage.filter(Route,
+                                              partner_id=self.id).values())
@@ -5,12 +5,10 @@
 import models
 
 from datetime import datetime
-from models.base_model import BaseModel, Base
+from models.base_model import BaseModel, Base, table_indexes
 from sqlalchemy import Column, String, ForeignKey, Integer, DateTime
 from os import getenv
 
-DATETIME_ISO = '%Y-%m-%dT%H:%M'
-
 class Route(BaseModel, Base):
     """Route object definition.
     
@@ -35,8 +33,15 @@ class Route(BaseModel, Base):
     slots_available : int
         The slots available for this route
     """
-    if models.storage_type == 'db':
+    __datetime_fields__ = BaseModel.__datetime_fields__ + ('period_begin',
+                                                           'period_end')
+    __indexes__ = (('partner_id',), ('start_destination', 'end_destination'))
+
+    if models.orm_storage:
         __tablename__ = 'routes'
+        __table_args__ = table_indexes(
+            __tablename__, __indexes__,
+            case_insensitive=(('start_destination', 'end_destination'),))
         partner_id = Column(String(60), ForeignKey('partners.id'),
                             nullable=True)
         start_destination = Column(String(60), nullable=False)
@@ -68,8 +73,9 @@ class Route(BaseModel, Base):
         """
         super().__init__(*args, **kwargs)
 
-        if type(self.period_begin) is str:
-            self.period_begin = datetime.strptime(self.period_begin,
-                                                  DATETIME_ISO)
-        if type(self.period_end) is str:
-            self.period_end = datetime.strptime(self.period_end, DATETIME_ISO)
+        # Accepts both `YYYY-MM-DDTHH:MM` from the API and the full ISO format
+        # written by storage.
+        if self.period_begin and type(self.period_begin) is str:
+            self.period_begin = datetime.fromisoformat(self.period_begin)
+        if self.period_end and type(self.period_end) is str:
+            self.period_end = datetime.fromisoformat(self.period_end)
@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+
+"""Measures the write throughput of the file storage engine under concurrent
+saves, with and without group commit.
+
+Each of the given number of threads creates objects and saves each one with
+`storage.new()` and `storage.save()`, like concurrent booking requests do.
+Every configuration runs in journaled mode with `MICHOTE_FILE_FSYNC=batch`,
+so each write is flushed to disk. The number of saves per second is printed
+for each configuration.
+
+Usage:
+    python3 scripts/benchmark_group_commit.py [threads] [saves_per_thread]
+"""
+
+import os
+import sys
+import time
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp())
+
+from models.engine.file_storage import FileStorage
+from models.booked_trip import BookedTrip
+
+CONFIGURATIONS = (
+    ('direct', {}),
+    ('group commit 1 ms', {'MICHOTE_FILE_GROUP_COMMIT': '1',
+                           'MICHOTE_FILE_COMMIT_WINDOW': '1'}),
+    ('group commit 5 ms', {'MICHOTE_FILE_GROUP_COMMIT': '1',
+                           'MICHOTE_FILE_COMMIT_WINDOW': '5'}),
+)
+
+
+def run(storage, threads, saves):
+    """Saves `saves` objects from each of `threads` threads and returns the
+    number of seconds taken.
+    """
+    def book():
+        for _ in range(saves):
+            storage.new(BookedTrip(route_id='route', customer_id='customer',
+                                   no_of_seats_booked=1))
+            storage.save()
+
+    workers = [threading.Thread(target=book) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start
+
+
+def main():
+    """Runs every configuration and prints its throughput"""
+    threads = int(sys.argv[1]) if len(sys.argv) > 1 else 16
+    saves = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    print(f'{threads} threads x {saves} saves, fsync on every write')
+    for name, environment in CONFIGURATIONS:
+        os.chdir(tempfile.mkdtemp())
+        os.environ.update({'MICHOTE_FILE_JOURNAL': '1',
+                           'MICHOTE_FILE_FSYNC': 'batch'}, **environment)
+        for variable in ('MICHOTE_FILE_GROUP_COMMIT',
+                         'MICHOTE_FILE_COMMIT_WINDOW'):
+            if variable not in environment:
+                os.environ.pop(variable, None)
+        storage = FileStorage()
+        storage.reload()
+        seconds = run(storage, threads, saves)
+        assert storage.count(BookedTrip) == threads * saves
+        print(f'{name:>18}: {threads * saves / seconds:8.0f} saves/s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/python3
+
+"""Measures how long the file storage engine takes to load its JSON file.
+
+Generates a `models.json` file with the given number of records in a temporary
+directory and compares two ways of turning the parsed records into objects:
+
+    constructor - calls `<class>(**record)` for every record, which is how
+        `FileStorage.reload()` used to build objects (one `setattr` per
+        attribute plus timestamp parsing in `__init__`).
+    loader - calls `ObjectLoader.build_all()`, the registry-based loader used
+        by `FileStorage.reload()`.
+
+The time taken by a full `FileStorage.reload()` (reading and parsing the file,
+building the objects and the indexes) is printed as well, followed by the
+time taken by a reload in lazy mode (`MICHOTE_FILE_LAZY=1`), where objects
+are only built when they are first accessed.
+
+Usage:
+    python3 scripts/benchmark_reload.py [number_of_records]
+"""
+
+import os
+import sys
+import time
+import uuid
+import tempfile
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp())
+
+from models import storage
+from models.engine import fast_json
+from models.engine.loader import ObjectLoader
+from models.engine.file_storage import FileStorage
+from models.customer import Customer
+from models.route import Route
+from models.booked_trip import BookedTrip
+
+CLASSES = {'Customer': Customer, 'Route': Route, 'BookedTrip': BookedTrip}
+
+
+def make_records(count):
+    """Generates the dict representations of `count` objects"""
+    records = {}
+    now = datetime.now()
+    for i in range(count):
+        obj_id = str(uuid.uuid4())
+        stamp = (now + timedelta(microseconds=i)).isoformat()
+        if i % 10 == 0:
+            record = {'__class__': 'Route', 'partner_id': str(uuid.uuid4()),
+                      'start_destination': 'Nairobi',
+                      'end_destination': 'Mombasa',
+                      'period_begin': '2024-01-01T08:00:00',
+                      'period_end': '2024-06-30T08:00:00',
+                      'price_per_ticket': 1500, 'currency': 'KES',
+                      'slots_available': 60}
+        elif i % 10 == 1:
+            record = {'__class__': 'Customer', 'first_name': 'Jane',
+                      'last_name': 'Doe', 'email': f'jane{i}@example.com',
+                      'password': 'pwd', 'country': 'Kenya',
+                      'phone_number': '0700000000', 'trips_booked': 1}
+        else:
+            record = {'__class__': 'BookedTrip', 'route_id': str(uuid.uuid4()),
+                      'partner_id': str(uuid.uuid4()),
+                      'customer_id': str(uuid.uuid4()),
+                      'no_of_seats_booked': 2, 'total_amount': 3000}
+        record.update({'id': obj_id, 'created_at': stamp,
+                       'last_updated': stamp})
+        records[f"{record['__class__']}.{obj_id}"] = record
+    return records
+
+
+def read_records(path):
+    """Reads and parses the JSON file"""
+    with open(path, 'rb') as json_file:
+        return fast_json.loads(json_file.read())
+
+
+def timed(function, *args):
+    """Returns the number of seconds taken by a function call"""
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+
+def build_with_constructor(records):
+    """Builds the objects by calling the constructor of every object"""
+    return [CLASSES[record['__class__']](**record)
+            for record in records.values()]
+
+
+def main():
+    """Runs the benchmark and prints the load time per 100k records"""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    with open('models.json', 'wb') as json_file:
+        json_file.write(fast_json.dumps_bytes(make_records(count)))
+
+    loader = ObjectLoader(CLASSES)
+    results = (
+        ('constructor', timed(build_with_constructor,
+                              read_records('models.json'))),
+        ('loader', timed(loader.build_all, read_records('models.json'))),
+        ('reload', timed(storage.reload)),
+    )
+    assert storage.count() == count
+
+    os.environ['MICHOTE_FILE_LAZY'] = '1'
+    lazy_storage = FileStorage()
+    results += (('lazy reload', timed(lazy_storage.reload)),)
+    assert lazy_storage.count() == count
+    print(f'records: {count} (JSON backend: {fast_json.BACKEND})')
+    for name, seconds in results:
+        print(f'{name:>12}: {seconds:.3f}s total, '
+              f'{seconds * 100000 / count:.3f}s per 100k records')
+
+
+if __name__ == '__main__':
+    main()
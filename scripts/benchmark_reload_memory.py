@@ -0,0 +1,158 @@
+#!/usr/bin/python3
+
+"""Measures the peak memory used by the file storage engine while it loads
+its JSON file.
+
+Generates a `models.json` file with the given number of records in a temporary
+directory, then loads it in a fresh process for each of the following ways:
+
+    whole file - `FileStorage.reload()` reading the whole file and parsing
+        it into a dict holding all the records before building the objects,
+        which is how it used to load the file.
+    streaming - `FileStorage.reload()`, which reads the file one batch of
+        records at a time and builds each object as soon as it is read.
+
+The file is generated and loaded in processes of their own, since the peak
+RSS of a process is inherited by the processes it forks.
+
+Both are run with the file in the json and in the binary format. For each
+run, the resident set size (RSS) of the process is printed before loading,
+at its peak while loading and once the objects are loaded. The peak of the
+streaming reload should stay close to the final RSS, which is what the loaded
+objects take.
+
+Usage:
+    python3 scripts/benchmark_reload_memory.py [number_of_records]
+"""
+
+import os
+import sys
+import time
+import uuid
+import resource
+import tempfile
+import subprocess
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MODES = ('whole file', 'streaming')
+
+
+def make_records(count):
+    """Generates the dict representations of `count` objects"""
+    records = {}
+    now = datetime.now()
+    for i in range(count):
+        obj_id = str(uuid.uuid4())
+        stamp = (now + timedelta(microseconds=i)).isoformat()
+        if i % 2 == 0:
+            record = {'__class__': 'Route', 'partner_id': str(uuid.uuid4()),
+                      'start_destination': 'Nairobi',
+                      'end_destination': 'Mombasa',
+                      'period_begin': '2024-01-01T08:00:00',
+                      'period_end': '2024-06-30T08:00:00',
+                      'price_per_ticket': 1500, 'currency': 'KES',
+                      'slots_available': 60}
+        else:
+            record = {'__class__': 'BookedTrip',
+                      'route_id': str(uuid.uuid4()),
+                      'customer_id': str(uuid.uuid4()),
+                      'no_of_seats_booked': 2}
+        record.update({'id': obj_id, 'created_at': stamp,
+                       'last_updated': stamp})
+        records[f"{record['__class__']}.{obj_id}"] = record
+    return records
+
+
+def peak_rss():
+    """Returns the peak resident set size of the process in MiB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def current_rss():
+    """Returns the resident set size of the process in MiB, or the peak when
+    it cannot be read from `/proc`.
+    """
+    try:
+        with open('/proc/self/status', encoding='utf-8') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return peak_rss()
+
+
+def load(mode):
+    """Loads `models.json` from the current directory in the given mode and
+    prints the RSS before, during and after loading.
+    """
+    # Importing `models` loads the storage of the current directory, so the
+    # modules are imported from an empty directory.
+    data_directory = os.getcwd()
+    os.chdir(tempfile.mkdtemp())
+    from models.engine import snapshot
+    from models.engine.file_storage import FileStorage
+    os.chdir(data_directory)
+
+    if mode == 'whole file':
+        read = snapshot.read
+        snapshot.iter_records = lambda path: iter(read(path).items())
+    storage = FileStorage()
+    before = current_rss()
+    start = time.perf_counter()
+    storage.reload()
+    count = storage.count()
+    seconds = time.perf_counter() - start
+    print(f'{count}\t{seconds:.2f}\t{before:.0f}\t{peak_rss():.0f}\t'
+          f'{current_rss():.0f}')
+
+
+def generate(count, file_format):
+    """Writes `models.json` with `count` records in the given format to the
+    current directory"""
+    from models.engine import snapshot
+    snapshot.write('models.json', make_records(count), file_format)
+
+
+def run(*args):
+    """Runs this script in a new process and returns its last output line"""
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__)] + list(args),
+        check=True, capture_output=True, text=True,
+        env=dict(os.environ, PYTHONPATH=ROOT)).stdout
+    return output.strip().splitlines()[-1] if output.strip() else ''
+
+
+def main():
+    """Generates the file and loads it in every mode, in fresh processes"""
+    if len(sys.argv) > 2 and sys.argv[1] == '--load':
+        load(sys.argv[2])
+        return
+    if len(sys.argv) > 3 and sys.argv[1] == '--generate':
+        generate(int(sys.argv[2]), sys.argv[3])
+        return
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    os.chdir(tempfile.mkdtemp())
+    print(f'{count} records, RSS in MiB')
+    print(f'{"format":>8} {"mode":>12} {"size":>9} {"time":>7} '
+          f'{"before":>7} {"peak":>7} {"after":>7}')
+    for file_format in ('json', 'binary'):
+        run('--generate', str(count), file_format)
+        size = os.path.getsize('models.json') / (1024 * 1024)
+        for mode in MODES:
+            loaded, seconds, before, peak, after = \
+                run('--load', mode).split('\t')
+            assert int(loaded) == count
+            print(f'{file_format:>8} {mode:>12} {size:7.1f}MB {seconds:>6}s '
+                  f'{before:>7} {peak:>7} {after:>7}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/python3
+
+"""Compares the load and save times of the snapshot formats of the file
+storage engine.
+
+For each dataset size, records are generated as in `benchmark_reload.py` and
+written (`save`) then read back (`load`) in every format supported by
+`models.engine.snapshot`, uncompressed and with every available compression
+(zstd is skipped when the `zstandard` package is not installed). A full
+`FileStorage.reload()` of the written file is timed as well. The file size is
+printed next to the timings.
+
+Usage:
+    python3 scripts/benchmark_snapshot.py [number_of_records ...]
+"""
+
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp())
+
+from benchmark_reload import make_records, timed
+from models import storage
+from models.engine import fast_json, snapshot
+
+
+def main():
+    """Runs the benchmark for every dataset size given on the command line"""
+    counts = [int(arg) for arg in sys.argv[1:]] or [1000, 10000, 100000]
+    print(f'JSON backend: {fast_json.BACKEND}')
+    compressions = [compression for compression in snapshot.COMPRESSIONS
+                    if compression != 'zstd' or snapshot.zstandard is not None]
+    print(f'{"records":>8} {"format":>7} {"compression":>11} {"size":>12} '
+          f'{"save":>8} {"load":>8} {"reload":>8}')
+    for count in counts:
+        records = make_records(count)
+        for file_format in snapshot.FORMATS:
+            for compression in compressions:
+                save = timed(snapshot.write, 'models.json', records,
+                             file_format, False, compression)
+                load = timed(snapshot.read, 'models.json')
+                reload = timed(storage.reload)
+                assert storage.count() == count
+                print(f'{count:>8} {file_format:>7} {compression:>11} '
+                      f'{os.path.getsize("models.json"):>12} {save:>7.3f}s '
+                      f'{load:>7.3f}s {reload:>7.3f}s')
+
+
+if __name__ == '__main__':
+    main()
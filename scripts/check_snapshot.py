@@ -0,0 +1,82 @@
+#!/usr/bin/python3
+
+"""Checks that the snapshot formats of the file storage engine give back
+the objects they were given.
+
+Records are generated as in `benchmark_reload.py`, together with objects of
+different classes having exactly the same attributes (eg a `BaseModel` and a
+`Customer` created without attributes), and written then read back in every
+format supported by `models.engine.snapshot`, uncompressed and with every
+available compression, with both `snapshot.read()` and
+`snapshot.iter_records()`. Each object must come back under its own storage
+key, with the same attributes. The script exits with status 1 on the first
+mismatch.
+
+Usage:
+    python3 scripts/check_snapshot.py [number_of_records]
+"""
+
+import os
+import sys
+import uuid
+import tempfile
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp())
+
+from benchmark_reload import make_records
+from models.engine import snapshot
+
+
+def make_lookalikes(cls_names):
+    """Generates the dict representations of one object of each class, all
+    having the same attributes. Their timestamps are datetime objects, which
+    are read back in ISO format.
+    """
+    records = {}
+    now = datetime.now()
+    for cls_name in cls_names:
+        obj_id = str(uuid.uuid4())
+        records[f'{cls_name}.{obj_id}'] = {'__class__': cls_name, 'id': obj_id,
+                                           'created_at': now,
+                                           'last_updated': now}
+    return records
+
+
+def expected(records):
+    """Returns the records as they should be read back"""
+    return {key: {name: value.isoformat() if isinstance(value, datetime)
+                  else value for name, value in record.items()}
+            for key, record in records.items()}
+
+
+def main():
+    """Runs the checks, with the number of records given on the command
+    line (1000 by default)"""
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    records = make_records(count)
+    records.update(make_lookalikes(['BaseModel', 'Customer', 'Admin',
+                                    'Partner']))
+    want = expected(records)
+    compressions = [compression for compression in snapshot.COMPRESSIONS
+                    if compression != 'zstd' or snapshot.zstandard is not None]
+    failed = False
+    for file_format in snapshot.FORMATS:
+        for compression in compressions:
+            snapshot.write('models.json', records, file_format,
+                           compression=compression)
+            results = {'read': snapshot.read('models.json'),
+                       'iter_records': dict(
+                           snapshot.iter_records('models.json'))}
+            for method, got in results.items():
+                ok = got == want
+                failed = failed or not ok
+                print(f'{file_format:>7} {compression:>5} {method:>12} '
+                      f'{"ok" if ok else "MISMATCH"}')
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/python3
+
+"""Checks that the file storage engine stays consistent when threads write
+and pick up changes at the same time.
+
+Writer threads create and delete objects while reader threads call
+`storage.close()`, as the API does after every request, and read. The
+journal is kept small (`MICHOTE_JOURNAL_MAX_SIZE`), so that background
+compactions run all along. The check fails if any thread raised, or if the
+objects in memory differ from the objects read back from the files by a new
+storage once every thread is done.
+
+The storage options are taken from the environment (journal mode is turned
+on by default). The script exits with status 1 on failure.
+
+Usage:
+    python3 scripts/check_threads.py [writers] [readers] [saves_per_writer]
+
+Example:
+    MICHOTE_FILE_GROUP_COMMIT=1 python3 scripts/check_threads.py 4 4 200
+"""
+
+import os
+import sys
+import tempfile
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(tempfile.mkdtemp())
+os.environ.setdefault('MICHOTE_FILE_JOURNAL', '1')
+os.environ.setdefault('MICHOTE_JOURNAL_MAX_SIZE', '5000')
+
+from models import storage
+from models.customer import Customer
+from models.engine.file_storage import FileStorage
+
+
+def main():
+    """Runs the writer and reader threads, then compares the objects in
+    memory with the objects in the files"""
+    args = [int(arg) for arg in sys.argv[1:]]
+    writers, readers, saves = (args + [4, 4, 200][len(args):])[:3]
+    errors = []
+    done = threading.Event()
+
+    def write(number):
+        try:
+            created = []
+            for i in range(saves):
+                customer = Customer(first_name=f'w{number}-{i}')
+                customer.save()
+                created.append(customer)
+                if i % 5 == 4:
+                    storage.delete(created.pop(0))
+                    storage.save()
+        except Exception as error:
+            errors.append(repr(error))
+
+    def read():
+        try:
+            while not done.is_set():
+                storage.close()
+                storage.count(Customer)
+        except Exception as error:
+            errors.append(repr(error))
+
+    threads = [threading.Thread(target=write, args=(number,))
+               for number in range(writers)]
+    reader_threads = [threading.Thread(target=read) for _ in range(readers)]
+    for thread in threads + reader_threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    done.set()
+    for thread in reader_threads:
+        thread.join()
+
+    storage.close()
+    in_memory = set(storage.all(Customer))
+    fresh = FileStorage()
+    fresh.reload()
+    on_disk = set(fresh.all(Customer))
+    expected = writers * (saves - saves // 5)
+    print(f'errors: {errors}')
+    print(f'in memory: {len(in_memory)}, on disk: {len(on_disk)}, '
+          f'expected: {expected}')
+    sys.exit(0 if not errors and in_memory == on_disk and
+             len(on_disk) == expected else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+#!/usr/bin/python3
+
+"""Converts the file storage snapshot (`models.json`) to another format.
+
+The format and compression of the input file are detected automatically. The
+output file is compressed as set by `MICHOTE_FILE_COMPRESSION` (uncompressed
+by default). The file is converted in place unless an output path is given.
+
+Usage:
+    python3 scripts/convert_snapshot.py <json|binary> [input] [output]
+
+Example:
+    python3 scripts/convert_snapshot.py binary models.json
+    MICHOTE_FILE_COMPRESSION=gzip python3 scripts/convert_snapshot.py json
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.engine import snapshot
+
+
+def main():
+    """Converts the snapshot file given on the command line"""
+    if len(sys.argv) < 2 or sys.argv[1] not in snapshot.FORMATS:
+        print(__doc__.strip(), file=sys.stderr)
+        sys.exit(1)
+    file_format = sys.argv[1]
+    input_path = sys.argv[2] if len(sys.argv) > 2 else 'models.json'
+    output_path = sys.argv[3] if len(sys.argv) > 3 else input_path
+    compression = os.getenv('MICHOTE_FILE_COMPRESSION', 'none')
+    snapshot.check_compression(compression)
+
+    with open(input_path, 'rb') as snapshot_file:
+        data = snapshot_file.read()
+    records = snapshot.loads(data)
+    snapshot.write(output_path, records, file_format, compression=compression)
+    print(f'{input_path} ({snapshot.detect_format(snapshot.decompress(data))}'
+          f', {snapshot.detect_compression(data)}, {len(data)} bytes) -> '
+          f'{output_path} ({file_format}, {compression}, '
+          f'{os.path.getsize(output_path)} bytes): {len(records)} objects')
+
+
+if __name__ == '__main__':
+    main()